@@ -0,0 +1,457 @@
+import io
+import itertools
+import os
+import struct
+
+import numpy as np
+import cv2
+from PIL import Image
+
+from rotation import DiscSpinner, angular_blur, default_engine, spin_blur_angle
+from tiled import _png_chunk
+
+
+# 저장 형식별 확장자
+FORMATS = {
+    ".gif": "gif",
+    ".png": "apng",
+    ".apng": "apng",
+    ".webp": "webp",
+    ".mp4": "mp4",
+}
+
+
+def _frame_duration_ms(fps):
+    return max(1, int(round(1000 / fps)))
+
+
+def _to_rgba_array(image):
+    if isinstance(image, Image.Image):
+        if image.mode != "RGBA":
+            image = image.convert("RGBA")
+        return np.asarray(image)
+    return np.asarray(image)
+
+
+def prepare_spin_source(image, size=None, disc=None):
+    # 회전할 원본을 RGBA 배열로 준비
+    # 출력 크기가 다르면 원본을 한 번만 줄이고, disc 도 같은 비율로 맞춤
+    source = _to_rgba_array(image)
+    height, width = source.shape[:2]
+    if size is not None and tuple(size) != (width, height):
+        scale_x, scale_y = size[0] / width, size[1] / height
+        source = cv2.resize(source, tuple(size), interpolation=cv2.INTER_AREA)
+        if disc is not None:
+            cx, cy, r = disc
+            disc = (cx * scale_x, cy * scale_y, r * min(scale_x, scale_y))
+    return np.ascontiguousarray(source), disc
+
+
+def spin_angles(frames, start_angle=0.0, clockwise=False):
+    step = (-360.0 if clockwise else 360.0) / frames
+    return [start_angle + i * step for i in range(frames)]
+
+
+class SpinRenderer:
+    # 한 각도의 프레임을 out 버퍼에 그림
+    # disc 가 있으면 CD 원 영역만 회전 (rotate_cd(disc=...) 와 같음), 없으면 전체 캔버스 회전 (rotate_image 와 같음)
+    # patch 가 있으면 rotate_cd 처럼 회전된 프레임의 (50, 50) 위치에 덮어씀
+    # blur_angle 이 있으면 회전하는 부분에만 원 둘레 방향 모션 블러를 미리 한 번 적용
+    def __init__(self, source, disc=None, patch=None, blur_angle=0.0):
+        self.source = source
+        self.disc = disc
+        self.patch = None if patch is None else _to_rgba_array(patch)
+        self._spinner = None if disc is None else DiscSpinner(source, disc=disc, blur_angle=blur_angle)
+        self._center = (source.shape[1] / 2, source.shape[0] / 2)
+        self._rotating = source
+        if disc is None and blur_angle > 0:
+            self._rotating = angular_blur(source, blur_angle, center=self._center)
+
+    def new_frame(self):
+        # disc 모드에서는 ROI 밖 정적 배경이 미리 들어 있어야 하므로 원본으로 채워 둠
+        return self.source.copy() if self._spinner is not None else np.empty_like(self.source)
+
+    def render(self, angle, out):
+        if self._spinner is not None:
+            self._spinner.render(angle, out=out)
+        else:
+            default_engine.rotate(self._rotating, angle, center=self._center, out=out)
+        if self.patch is not None:
+            out[50:50+self.patch.shape[0], 50:50+self.patch.shape[1]] = self.patch
+        return out
+
+
+def iter_spin_frames(image, frames=36, size=None, disc=None, patch=None, start_angle=0.0, clockwise=False,
+                     blur_angle=0.0):
+    # 이미지를 360도 회전시키는 프레임을 하나씩 생성 (메모리에는 한 프레임만 유지)
+    # 같은 프레임 버퍼를 재사용하므로 프레임을 보관하려면 복사해야 함
+    source, disc = prepare_spin_source(image, size=size, disc=disc)
+    renderer = SpinRenderer(source, disc=disc, patch=patch, blur_angle=blur_angle)
+    frame = renderer.new_frame()
+    for angle in spin_angles(frames, start_angle=start_angle, clockwise=clockwise):
+        yield renderer.render(angle, frame)
+
+
+class GifWriter:
+    # 프레임마다 Pillow 로 단일 GIF 를 만든 뒤 이미지 블록만 떼어 이어 붙이는 스트리밍 GIF 저장기
+    supports_delta = True
+    offset_align = 1
+
+    def __init__(self, fp, size, fps, loop=0, alpha_threshold=128):
+        self.fp = fp
+        self.size = tuple(size)
+        self.delay = max(2, int(round(100 / fps)))
+        self.alpha_threshold = alpha_threshold
+        width, height = self.size
+        # 헤더 + 논리 화면 (전역 색상표 없음) + 무한 반복(NETSCAPE2.0) 확장
+        fp.write(b"GIF89a" + struct.pack("<HHBBB", width, height, 0, 0, 0))
+        fp.write(b"\x21\xff\x0bNETSCAPE2.0\x03\x01" + struct.pack("<H", loop) + b"\x00")
+
+    def write(self, frame, offset=(0, 0), duration=None, dispose=True):
+        # 알파가 기준보다 낮은 픽셀은 255 번 투명 색으로, 나머지는 255색 이하로 양자화
+        rgb = Image.fromarray(np.ascontiguousarray(frame[..., :3]), "RGB")
+        indexed = rgb.quantize(colors=255, method=Image.Quantize.FASTOCTREE)
+        indices = np.array(indexed)
+        indices[frame[..., 3] < self.alpha_threshold] = 255
+        palette = indexed.getpalette()[:255 * 3]
+        palette += [0] * (256 * 3 - len(palette))
+        indexed = Image.fromarray(indices, "P")
+        indexed.putpalette(palette)
+
+        buf = io.BytesIO()
+        indexed.save(buf, "GIF", transparency=255, optimize=False, interlace=False)
+        color_table, image_data = _split_gif(buf.getvalue())
+
+        delay = self.delay if duration is None else max(2, int(round(duration / 10)))
+        height, width = frame.shape[:2]
+        # 그래픽 제어 확장: disposal (1 = 이 프레임을 남겨 둠, 2 = 다음 프레임 전에 배경으로 지움), 255 번 투명
+        disposal = 2 if dispose else 1
+        self.fp.write(b"\x21\xf9\x04" + struct.pack("<BHBB", (disposal << 2) | 1, delay, 255, 0))
+        # 이미지 설명자 + 지역 색상표 + LZW 데이터
+        size_bits = (len(color_table) // 3).bit_length() - 2
+        self.fp.write(b"\x2c" + struct.pack("<HHHHB", offset[0], offset[1], width, height, 0x80 | size_bits))
+        self.fp.write(color_table)
+        self.fp.write(image_data)
+
+    def close(self):
+        self.fp.write(b"\x3b")
+
+
+def _split_gif(data):
+    # 단일 프레임 GIF 에서 색상표와 이미지 데이터(LZW 최소 코드 크기 + 서브 블록)를 꺼냄
+    flags = data[10]
+    pos = 13
+    color_table = b""
+    if flags & 0x80:
+        table_size = 3 * (2 << (flags & 0x07))
+        color_table = data[pos:pos + table_size]
+        pos += table_size
+    while pos < len(data):
+        block = data[pos]
+        if block == 0x21:
+            pos += 2
+            while data[pos]:
+                pos += data[pos] + 1
+            pos += 1
+        elif block == 0x2c:
+            image_flags = data[pos + 9]
+            pos += 10
+            if image_flags & 0x80:
+                table_size = 3 * (2 << (image_flags & 0x07))
+                color_table = data[pos:pos + table_size]
+                pos += table_size
+            start = pos
+            pos += 1
+            while data[pos]:
+                pos += data[pos] + 1
+            pos += 1
+            return color_table, data[start:pos]
+        else:
+            break
+    raise ValueError("GIF 이미지 블록을 찾을 수 없습니다.")
+
+
+def _iter_png_chunks(data):
+    pos = 8
+    while pos < len(data):
+        length, chunk_type = struct.unpack(">I4s", data[pos:pos + 8])
+        yield chunk_type, data[pos + 8:pos + 8 + length]
+        pos += 12 + length
+
+
+class ApngWriter:
+    # 프레임마다 Pillow 로 PNG 를 만든 뒤 IDAT 를 fdAT 로 옮겨 담는 스트리밍 APNG 저장기
+    supports_delta = True
+    offset_align = 1
+
+    def __init__(self, fp, size, fps, loop=0, compress_level=6):
+        self.fp = fp
+        self.size = tuple(size)
+        self.duration = _frame_duration_ms(fps)
+        self.loop = loop
+        self.compress_level = compress_level
+        self.frame_count = 0
+        self._sequence = 0
+        self._actl_offset = None
+
+    def write(self, frame, offset=(0, 0), duration=None, dispose=False):
+        buf = io.BytesIO()
+        Image.fromarray(np.ascontiguousarray(frame), "RGBA").save(buf, "PNG", compress_level=self.compress_level)
+        chunks = list(_iter_png_chunks(buf.getvalue()))
+
+        if self.frame_count == 0:
+            # 첫 프레임: PNG 서명 + IHDR + acTL(프레임 수는 close 에서 채움)
+            ihdr = next(payload for chunk_type, payload in chunks if chunk_type == b"IHDR")
+            self.fp.write(b"\x89PNG\r\n\x1a\n" + _png_chunk(b"IHDR", ihdr))
+            self._actl_offset = self.fp.tell()
+            self.fp.write(_png_chunk(b"acTL", struct.pack(">II", 0, self.loop)))
+
+        height, width = frame.shape[:2]
+        delay = self.duration if duration is None else int(duration)
+        # dispose_op: 0 = 그대로 둠, 1 = 배경(투명)으로 지움 / blend_op: 0 = 영역을 그대로 덮어씀
+        self.fp.write(_png_chunk(b"fcTL", struct.pack(">IIIIIHHBB", self._sequence, width, height,
+                                                      offset[0], offset[1], delay, 1000,
+                                                      1 if dispose else 0, 0)))
+        self._sequence += 1
+        for chunk_type, payload in chunks:
+            if chunk_type != b"IDAT":
+                continue
+            if self.frame_count == 0:
+                self.fp.write(_png_chunk(b"IDAT", payload))
+            else:
+                self.fp.write(_png_chunk(b"fdAT", struct.pack(">I", self._sequence) + payload))
+                self._sequence += 1
+        self.frame_count += 1
+
+    def close(self):
+        self.fp.write(_png_chunk(b"IEND", b""))
+        # acTL 의 프레임 수를 실제 기록한 수로 갱신
+        if self._actl_offset is not None:
+            end = self.fp.tell()
+            self.fp.seek(self._actl_offset)
+            self.fp.write(_png_chunk(b"acTL", struct.pack(">II", self.frame_count, self.loop)))
+            self.fp.seek(end)
+
+
+def _riff_chunk(chunk_type, payload):
+    data = chunk_type + struct.pack("<I", len(payload)) + payload
+    if len(payload) % 2:
+        data += b"\x00"
+    return data
+
+
+def _iter_riff_chunks(data):
+    pos = 12
+    while pos < len(data):
+        chunk_type = data[pos:pos + 4]
+        length = struct.unpack("<I", data[pos + 4:pos + 8])[0]
+        yield chunk_type, data[pos + 8:pos + 8 + length]
+        pos += 8 + length + (length % 2)
+
+
+def _uint24(value):
+    return struct.pack("<I", value)[:3]
+
+
+class WebPWriter:
+    # 프레임마다 Pillow 로 정지 WebP 를 만든 뒤 비트스트림만 ANMF 청크로 감싸는 스트리밍 WebP 저장기
+    supports_delta = True
+    # ANMF 의 프레임 위치는 짝수 좌표만 가능
+    offset_align = 2
+
+    def __init__(self, fp, size, fps, loop=0, lossless=False, quality=80, method=4):
+        self.fp = fp
+        self.size = tuple(size)
+        self.duration = _frame_duration_ms(fps)
+        self.lossless = lossless
+        self.quality = quality
+        self.method = method
+        self.frame_count = 0
+        width, height = self.size
+        self._start = fp.tell()
+        fp.write(b"RIFF\x00\x00\x00\x00WEBP")
+        # VP8X: 애니메이션 + 알파 플래그, 캔버스 크기
+        fp.write(_riff_chunk(b"VP8X", bytes([0x02 | 0x10, 0, 0, 0]) + _uint24(width - 1) + _uint24(height - 1)))
+        # ANIM: 배경색(투명), 반복 횟수
+        fp.write(_riff_chunk(b"ANIM", struct.pack("<IH", 0, loop)))
+
+    def write(self, frame, offset=(0, 0), duration=None, dispose=False):
+        buf = io.BytesIO()
+        Image.fromarray(np.ascontiguousarray(frame), "RGBA").save(
+            buf, "WEBP", lossless=self.lossless, quality=self.quality, method=self.method, exact=True)
+        bitstream = b"".join(_riff_chunk(chunk_type, payload)
+                             for chunk_type, payload in _iter_riff_chunks(buf.getvalue())
+                             if chunk_type in (b"ALPH", b"VP8 ", b"VP8L"))
+
+        height, width = frame.shape[:2]
+        delay = self.duration if duration is None else int(duration)
+        # ANMF 플래그: bit1 = 블렌딩 안 함(영역을 그대로 덮어씀), bit0 = 다음 프레임 전에 배경으로 지움
+        flags = 0x02 | (0x01 if dispose else 0)
+        header = (_uint24(offset[0] // 2) + _uint24(offset[1] // 2) + _uint24(width - 1)
+                  + _uint24(height - 1) + _uint24(delay) + bytes([flags]))
+        self.fp.write(_riff_chunk(b"ANMF", header + bitstream))
+        self.frame_count += 1
+
+    def close(self):
+        # RIFF 전체 크기 갱신
+        end = self.fp.tell()
+        self.fp.seek(self._start + 4)
+        self.fp.write(struct.pack("<I", end - self._start - 8))
+        self.fp.seek(end)
+
+
+class Mp4Writer:
+    # cv2.VideoWriter 로 프레임을 바로 인코딩 (알파는 background 색 위에 합성)
+    # 고정 fps 동영상이라 부분 프레임/중복 제거는 하지 않음
+    supports_delta = False
+
+    def __init__(self, path, size, fps, fourcc="mp4v", background=(255, 255, 255)):
+        self.size = tuple(size)
+        self.background = np.array(background, dtype=np.float32)
+        self._writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*fourcc), fps, self.size)
+        if not self._writer.isOpened():
+            raise ValueError(f"동영상 파일을 열 수 없습니다: {path}")
+
+    def write(self, frame, offset=(0, 0), duration=None, dispose=False):
+        alpha = frame[..., 3:].astype(np.float32) / 255
+        rgb = frame[..., :3] * alpha + self.background * (1 - alpha)
+        self._writer.write(cv2.cvtColor(rgb.astype(np.uint8), cv2.COLOR_RGB2BGR))
+
+    def close(self):
+        self._writer.release()
+
+
+def _changed_bbox(prev, frame):
+    # 두 프레임에서 값이 달라진 픽셀들의 외접 사각형 (x0, y0, x1, y1), 완전히 같으면 None
+    changed = prev.view(np.uint32)[..., 0] != frame.view(np.uint32)[..., 0]
+    return _mask_bbox(changed)
+
+
+def _mask_bbox(mask, offset=(0, 0)):
+    rows = np.flatnonzero(mask.any(axis=1))
+    if rows.size == 0:
+        return None
+    cols = np.flatnonzero(mask[rows[0]:rows[-1] + 1].any(axis=0))
+    return (offset[0] + int(cols[0]), offset[1] + int(rows[0]),
+            offset[0] + int(cols[-1]) + 1, offset[1] + int(rows[-1]) + 1)
+
+
+def _union_bbox(a, b):
+    return (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+
+
+def _write_region(writer, canvas, rect, duration, dispose):
+    x0, y0, x1, y1 = rect
+    writer.write(canvas[y0:y1, x0:x1], offset=(x0, y0), duration=duration, dispose=dispose)
+
+
+def write_frames(writer, frames, duration, delta=True):
+    # 프레임들을 writer 에 기록
+    # delta=True 이고 형식이 지원하면 이전 프레임과 달라진 사각형 영역만 부분 프레임으로 기록하고,
+    # 이전 프레임과 완전히 같은 프레임은 새로 기록하지 않고 이전 프레임의 표시 시간을 늘림
+    if not delta or not writer.supports_delta:
+        for frame in frames:
+            writer.write(frame, duration=duration)
+        return
+
+    threshold = getattr(writer, "alpha_threshold", None)
+    align = writer.offset_align
+    prev = None
+    # 아직 기록하지 않은 직전 프레임: [영역, 표시 시간(ms), 다음 프레임 전에 지울지 여부]
+    pending = None
+    first = True  # pending 이 아직 전체 캔버스인 첫 프레임인지
+    for frame in frames:
+        if prev is None:
+            prev = frame.copy()
+            pending = [(0, 0, frame.shape[1], frame.shape[0]), duration, False]
+            continue
+
+        bbox = _changed_bbox(prev, frame)
+        if bbox is None:
+            pending[1] += duration
+            continue
+
+        rect = bbox
+        if threshold is not None:
+            # GIF 는 투명 픽셀로 이전 내용을 지울 수 없으므로, 불투명 -> 투명으로 바뀐 픽셀이 있으면
+            # 직전 프레임을 '배경으로 지움' 으로 바꾸고 지워진 영역 전체를 이번 프레임에서 다시 그림
+            x0, y0, x1, y1 = bbox
+            cleared = prev[y0:y1, x0:x1, 3] >= threshold
+            cleared &= frame[y0:y1, x0:x1, 3] < threshold
+            cleared_bbox = _mask_bbox(cleared, offset=(x0, y0))
+            if cleared_bbox is not None:
+                if first:
+                    # 첫 프레임(전체 캔버스)을 지우면 다시 그릴 영역도 전체 캔버스가 되어 이후 모든 프레임이
+                    # 전체 크기가 되므로, 전체 캔버스는 남겨 두는 프레임으로 기록하고
+                    # 지울 영역만 같은 내용으로 한 번 더 기록 (표시 시간은 둘로 나눔)
+                    half = pending[1] // 2
+                    _write_region(writer, prev, pending[0], half, False)
+                    cx0, cy0, cx1, cy1 = cleared_bbox
+                    pending = [(cx0 - cx0 % align, cy0 - cy0 % align, cx1, cy1), pending[1] - half, True]
+                    first = False
+                else:
+                    pending[0] = _union_bbox(pending[0], cleared_bbox)
+                    pending[2] = True
+                rect = _union_bbox(rect, pending[0])
+
+        _write_region(writer, prev, *pending)
+        first = False
+        x0, y0, x1, y1 = rect
+        pending = [(x0 - x0 % align, y0 - y0 % align, x1, y1), duration, False]
+        np.copyto(prev, frame)
+
+    if pending is not None:
+        _write_region(writer, prev, *pending)
+
+
+def guess_format(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in FORMATS:
+        raise ValueError(f"지원하지 않는 파일 형식입니다: {ext} (gif, png/apng, webp, mp4)")
+    return FORMATS[ext]
+
+
+def export_spin(path, image, frames=36, fps=24, size=None, fmt=None, disc=None, patch=None,
+                loop=0, clockwise=False, optimize=True, workers=None, rpm=None, shutter=None, **options):
+    # 회전 애니메이션을 GIF / APNG / WebP / MP4 로 저장
+    # 프레임은 생성기에서 하나씩 받아 바로 인코딩하므로 프레임 수와 관계없이 메모리 사용량이 일정함
+    # optimize=True 면 GIF / APNG / WebP 는 바뀐 영역만 부분 프레임으로 기록하고 같은 프레임은 합침
+    # workers 가 2 이상이면 프레임을 프로세스 풀에서 병렬로 그림
+    # rpm 을 주면 셔터 시간(초, 기본은 프레임 간격의 절반) 동안 돈 각도만큼 모션 블러를 넣음
+    fmt = fmt or guess_format(path)
+    blur_angle = 0.0
+    if rpm:
+        if shutter is None:
+            shutter = 0.5 / fps
+        blur_angle = min(360.0, abs(spin_blur_angle(rpm, shutter)))
+    if workers and workers > 1:
+        from parallel import iter_spin_frames_parallel
+        frame_iter = iter_spin_frames_parallel(image, frames=frames, size=size, disc=disc, patch=patch,
+                                               clockwise=clockwise, workers=workers, blur_angle=blur_angle)
+    else:
+        frame_iter = iter_spin_frames(image, frames=frames, size=size, disc=disc, patch=patch, clockwise=clockwise,
+                                      blur_angle=blur_angle)
+    first = next(frame_iter)
+    out_size = (first.shape[1], first.shape[0])
+
+    if fmt == "mp4":
+        writer = Mp4Writer(path, out_size, fps, **options)
+        fp = None
+    else:
+        fp = open(path, "wb")
+        if fmt == "gif":
+            writer = GifWriter(fp, out_size, fps, loop=loop, **options)
+        elif fmt == "apng":
+            writer = ApngWriter(fp, out_size, fps, loop=loop, **options)
+        elif fmt == "webp":
+            writer = WebPWriter(fp, out_size, fps, loop=loop, **options)
+        else:
+            fp.close()
+            raise ValueError(f"지원하지 않는 애니메이션 형식입니다: {fmt}")
+    try:
+        write_frames(writer, itertools.chain([first], frame_iter), _frame_duration_ms(fps), delta=optimize)
+        writer.close()
+    finally:
+        if fp is not None:
+            fp.close()
+    return path
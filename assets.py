@@ -0,0 +1,189 @@
+import concurrent.futures
+import hashlib
+import json
+import os
+import re
+
+import numpy as np
+from PIL import Image
+
+from batch import list_images
+
+
+# CD 이미지 폴더(somang_cd/)를 한 번만 디코딩해 RGBA .npy 로 저장해 두는 에셋 저장소
+# 이후에는 np.load(mmap_mode="r") 로 바로 열리므로 PNG/JPEG 디코딩 비용이 없고,
+# 같은 파일을 여는 여러 워커 프로세스가 OS 페이지 캐시를 함께 씀
+# 저장 위치: <이미지 폴더>/.assets/ (index.json + <sha256 앞 16자>.npy)
+# 예) python cli.py assets somang_cd/
+
+ASSET_DIR_NAME = ".assets"
+INDEX_NAME = "index.json"
+INDEX_VERSION = 1
+# 저장소가 만든 .npy 이름 (<sha256 앞 16자>.npy), 이 이름이 아닌 파일은 건드리지 않음
+ASSET_NAME = re.compile(r"^[0-9a-f]{16}\.npy$")
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _source_stat(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def _decode_asset(path, store_dir):
+    # 이미지 하나를 디코딩해 .npy 로 저장하고 메타데이터를 돌려줌 (프로세스 풀 워커에서 실행)
+    # 파일 이름이 내용 해시이므로 같은 이미지가 여러 이름으로 있어도 .npy 는 하나만 만듦
+    from rotation import detect_disc
+
+    sha256 = _file_digest(path)
+    name = f"{sha256[:16]}.npy"
+    target = os.path.join(store_dir, name)
+    image = Image.open(path)
+    if image.mode != "RGBA":
+        image = image.convert("RGBA")
+    array = np.asarray(image)
+    if not os.path.exists(target):
+        partial = os.path.join(store_dir, f".{name}.{os.getpid()}.part")
+        with open(partial, "wb") as f:
+            np.save(f, array)
+        os.replace(partial, target)
+    disc = detect_disc(array[..., 3])
+    bytes_, mtime_ns = _source_stat(path)
+    return {
+        "file": name,
+        "size": [image.width, image.height],
+        "disc": None if disc is None else list(disc),
+        "sha256": sha256,
+        "source_bytes": bytes_,
+        "source_mtime_ns": mtime_ns,
+    }
+
+
+class AssetStore:
+    # directory: 원본 이미지 폴더, store_dir: .npy 와 index.json 을 둘 폴더 (기본: directory/.assets)
+    def __init__(self, directory, store_dir=None):
+        self.directory = directory
+        self.store_dir = store_dir or os.path.join(directory, ASSET_DIR_NAME)
+        self._index = self._read_index()
+
+    @property
+    def index_path(self):
+        return os.path.join(self.store_dir, INDEX_NAME)
+
+    def _read_index(self):
+        try:
+            with open(self.index_path, encoding="utf-8") as f:
+                index = json.load(f)
+        except FileNotFoundError:
+            return {}
+        if index.get("version") != INDEX_VERSION:
+            return {}
+        return index.get("assets", {})
+
+    def _write_index(self):
+        partial = os.path.join(self.store_dir, f".{INDEX_NAME}.part")
+        with open(partial, "w", encoding="utf-8") as f:
+            json.dump({"version": INDEX_VERSION, "assets": self._index}, f, ensure_ascii=False, indent=1)
+        os.replace(partial, self.index_path)
+
+    def _is_fresh(self, name):
+        # 원본 파일의 크기/수정 시각이 색인과 같고 .npy 가 있으면 다시 디코딩하지 않음
+        entry = self._index.get(name)
+        if entry is None:
+            return False
+        try:
+            bytes_, mtime_ns = _source_stat(os.path.join(self.directory, name))
+        except FileNotFoundError:
+            return False
+        return (entry["source_bytes"], entry["source_mtime_ns"]) == (bytes_, mtime_ns) \
+            and os.path.exists(os.path.join(self.store_dir, entry["file"]))
+
+    def build(self, workers=None, rebuild=False):
+        # 새로 생겼거나 바뀐 이미지만 디코딩하고, 폴더에서 사라진 이미지는 색인과 .npy 에서 지움
+        # 돌려주는 값: 이번에 디코딩한 이미지 이름 목록
+        os.makedirs(self.store_dir, exist_ok=True)
+        names = [os.path.basename(path) for path in list_images(self.directory)]
+        stale = [name for name in names if rebuild or not self._is_fresh(name)]
+        workers = workers or os.cpu_count() or 1
+
+        if stale:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=min(workers, len(stale))) as executor:
+                futures = {name: executor.submit(_decode_asset, os.path.join(self.directory, name),
+                                                 self.store_dir) for name in stale}
+                for name, future in futures.items():
+                    self._index[name] = future.result()
+
+        self._index = {name: self._index[name] for name in names}
+        used = {entry["file"] for entry in self._index.values()}
+        for file in os.listdir(self.store_dir):
+            path = os.path.join(self.store_dir, file)
+            if ASSET_NAME.match(file) and file not in used and os.path.isfile(path) and not os.path.islink(path):
+                os.remove(path)
+        self._write_index()
+        return stale
+
+    def names(self):
+        return sorted(self._index)
+
+    def _entry(self, name):
+        name = os.path.basename(name)
+        if name not in self._index:
+            raise ValueError(f"에셋 색인에 없는 이미지입니다: {name} (먼저 assets 명령으로 색인을 만드세요)")
+        return self._index[name]
+
+    def __contains__(self, name):
+        return os.path.basename(name) in self._index
+
+    def info(self, name):
+        # size: (w, h), disc: (cx, cy, r) 또는 None, sha256: 원본 파일 해시
+        entry = self._entry(name)
+        disc = entry["disc"]
+        return {"size": tuple(entry["size"]), "disc": None if disc is None else tuple(disc),
+                "sha256": entry["sha256"]}
+
+    def load(self, name):
+        # 읽기 전용 memmap (H x W x 4 uint8), 필요한 부분만 페이지 단위로 읽힘
+        return np.load(os.path.join(self.store_dir, self._entry(name)["file"]), mmap_mode="r")
+
+    def image(self, name):
+        # PIL 이미지가 필요한 곳에서 쓰는 사본 (memmap 에서 한 번 복사)
+        return Image.fromarray(np.array(self.load(name)), "RGBA")
+
+
+def open_store(path):
+    # path 가 들어 있는 폴더에 만들어 둔 에셋 저장소, 색인이 없으면 None
+    directory = os.path.dirname(os.path.abspath(path))
+    if not os.path.exists(os.path.join(directory, ASSET_DIR_NAME, INDEX_NAME)):
+        return None
+    return _store_for(directory)
+
+
+_stores = {}
+
+
+def _store_for(directory):
+    # 프로세스마다 폴더별 저장소 객체(색인)는 한 번만 읽음
+    if directory not in _stores:
+        _stores[directory] = AssetStore(directory)
+    return _stores[directory]
+
+
+def load_asset(path):
+    # 에셋 저장소에 최신 상태로 있으면 memmap 을, 아니면 원본을 디코딩한 RGBA 배열과 CD 원을 돌려줌
+    store = open_store(path)
+    name = os.path.basename(path)
+    if store is not None and name in store and store._is_fresh(name):
+        return store.load(name), store.info(name)["disc"]
+    from rotation import detect_disc
+
+    image = Image.open(path)
+    if image.mode != "RGBA":
+        image = image.convert("RGBA")
+    array = np.asarray(image)
+    return array, detect_disc(array[..., 3])
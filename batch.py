@@ -0,0 +1,153 @@
+import collections
+import concurrent.futures
+import csv
+import itertools
+import os
+import uuid
+
+import numpy as np
+from PIL import Image
+
+from core import apply_patch, merge_images
+
+
+# 배치 합성에서 입력으로 읽는 이미지 확장자
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp")
+
+BatchJob = collections.namedtuple("BatchJob", "background patch output position radius")
+
+
+def list_images(directory):
+    names = sorted(name for name in os.listdir(directory)
+                   if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS and not name.startswith("."))
+    return [os.path.join(directory, name) for name in names]
+
+
+def _source_labels(paths):
+    # 결과 파일 이름에 쓸 원본 이름: 보통은 확장자를 뺀 이름,
+    # 같은 폴더에 cover.png / cover.jpg 처럼 확장자만 다른 파일이 있으면 확장자까지 붙인 이름
+    stems = collections.Counter(os.path.splitext(os.path.basename(path))[0] for path in paths)
+    labels = {}
+    for path in paths:
+        name = os.path.basename(path)
+        stem = os.path.splitext(name)[0]
+        labels[path] = stem if stems[stem] == 1 else name
+    return labels
+
+
+def _output_name(background, patch, ext=".png", labels=None):
+    labels = labels or {}
+    bg_label = labels.get(background) or os.path.splitext(os.path.basename(background))[0]
+    patch_label = labels.get(patch) or os.path.splitext(os.path.basename(patch))[0]
+    return f"{bg_label}__{patch_label}{ext}"
+
+
+def _check_outputs(jobs):
+    # 두 작업이 같은 결과 파일에 쓰면 하나가 다른 하나를 덮어쓰므로 시작하기 전에 거부
+    seen = {}
+    for job in jobs:
+        output = os.path.normcase(os.path.abspath(job.output))
+        if output in seen:
+            other = seen[output]
+            raise ValueError(f"결과 파일 이름이 겹칩니다: {job.output} "
+                             f"({other.background} + {other.patch} / {job.background} + {job.patch})")
+        seen[output] = job
+
+
+def _optional_int(value):
+    value = (value or "").strip()
+    return int(value) if value else None
+
+
+def iter_pair_jobs(cd_dir, patch_dir, output_dir, position=None, radius=50):
+    # CD 이미지 폴더 x 패치 이미지 폴더의 모든 조합
+    backgrounds, patches = list_images(cd_dir), list_images(patch_dir)
+    labels = {**_source_labels(backgrounds), **_source_labels(patches)}
+    jobs = (BatchJob(background, patch, os.path.join(output_dir, _output_name(background, patch, labels=labels)),
+                     position, radius) for background, patch in itertools.product(backgrounds, patches))
+    if any("__" in label for label in labels.values()):
+        # 이름에 구분자(__)가 들어 있으면 a__b + c 와 a + b__c 처럼 겹칠 수 있으므로 먼저 모두 확인
+        jobs = list(jobs)
+        _check_outputs(jobs)
+    yield from jobs
+
+
+def iter_manifest_jobs(manifest_path, output_dir, cd_dir=None, patch_dir=None, position=None, radius=50):
+    # CSV 매니페스트의 행마다 작업 하나
+    # 열: background, patch (필수), x, y, radius, output (비어 있으면 기본값)
+    # 상대 경로는 cd_dir / patch_dir / output_dir 기준 (없으면 매니페스트 위치 기준)
+    # 결과 파일 이름이 겹치는 행이 있으면 작업을 시작하기 전에 ValueError
+    base = os.path.dirname(os.path.abspath(manifest_path))
+    rows = []
+    with open(manifest_path, newline="", encoding="utf-8") as f:
+        for line_no, row in enumerate(csv.DictReader(f), start=2):
+            if not row.get("background") or not row.get("patch"):
+                raise ValueError(f"매니페스트 {line_no}번째 줄에 background/patch 가 없습니다.")
+            rows.append((os.path.join(cd_dir or base, row["background"]),
+                         os.path.join(patch_dir or base, row["patch"]), row))
+    labels = {**_source_labels(sorted({background for background, _, _ in rows})),
+              **_source_labels(sorted({patch for _, patch, _ in rows}))}
+    jobs = []
+    for background, patch, row in rows:
+        x, y = _optional_int(row.get("x")), _optional_int(row.get("y"))
+        row_radius = _optional_int(row.get("radius"))
+        output = os.path.join(output_dir, row.get("output") or _output_name(background, patch, labels=labels))
+        jobs.append(BatchJob(background, patch, output,
+                             (x, y) if x is not None and y is not None else position,
+                             radius if row_radius is None else row_radius))
+    _check_outputs(jobs)
+    yield from jobs
+
+
+def compose_job(job, size=None, method="apply", antialias=False, key_mode="hard"):
+    # 작업 하나를 합성해 저장 (프로세스 풀 워커에서 실행)
+    # 중간에 중단돼도 깨진 파일이 남지 않도록 임시 파일에 쓴 뒤 이름을 바꿈
+    # 배경(CD) 이미지는 에셋 저장소(assets.py)가 있으면 디코딩 대신 .npy memmap 에서 읽음
+    from assets import load_asset
+
+    array, _ = load_asset(job.background)
+    background = Image.fromarray(np.asarray(array), "RGBA")
+    patch = Image.open(job.patch).convert("RGBA")
+    if size is not None:
+        background = background.resize(tuple(size))
+    # apply_patch 는 같은 크기를 요구하므로 패치를 배경 크기에 맞춤 (웹 UI 의 RESIZE 와 같음)
+    if patch.size != background.size:
+        patch = patch.resize(background.size)
+    position = job.position or (background.width // 2, background.height // 2)
+    if method == "merge":
+        merged = merge_images(background, patch, position, job.radius, key_mode=key_mode, antialias=antialias)
+    else:
+        merged = apply_patch(background, patch, position, job.radius, debug=False, antialias=antialias)
+
+    out_dir, out_name = os.path.split(job.output)
+    os.makedirs(out_dir or ".", exist_ok=True)
+    root, ext = os.path.splitext(out_name)
+    # 임시 파일 이름은 작업마다 다르게 (다른 배치가 같은 결과를 쓰는 중이어도 서로의 임시 파일을 건드리지 않음)
+    partial = os.path.join(out_dir, f".{root}.{uuid.uuid4().hex}.part{ext}")
+    merged.save(partial)
+    os.replace(partial, job.output)
+    return job.output
+
+
+def run_batch(jobs, workers=None, max_in_flight=None, overwrite=False, **options):
+    # 작업들을 프로세스 풀에서 합성하고 끝나는 순서대로 (job, error) 를 돌려줌
+    # 이미 결과 파일이 있는 작업은 건너뛰므로 중단된 배치를 같은 명령으로 이어서 실행할 수 있음
+    # 동시에 제출하는 작업 수를 max_in_flight 로 제한해 작업 목록/결과가 메모리에 쌓이지 않게 함
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or workers * 2
+    jobs = (job for job in jobs if overwrite or not os.path.exists(job.output))
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = {}
+        for job in itertools.chain(jobs, [None]):
+            if job is not None:
+                pending[executor.submit(compose_job, job, **options)] = job
+                if len(pending) < max_in_flight:
+                    continue
+            # 제출 한도에 닿았거나 작업이 더 없으면 끝난 것부터 돌려줌
+            while pending and (job is None or len(pending) >= max_in_flight):
+                done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    done_job = pending.pop(future)
+                    error = future.exception()
+                    yield done_job, error
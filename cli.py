@@ -0,0 +1,251 @@
+import argparse
+import sys
+
+from PIL import Image
+
+# streamlit 없이 명령줄에서 합성/회전/애니메이션 저장을 실행
+# 예) python cli.py compose bg.png patch.png -o merged.png --position 500 500 --radius 60
+#     python cli.py rotate merged.png -o rotated.png --angle 30 --disc
+#     python cli.py export merged.png -o spin.gif --frames 36 --fps 24 --disc
+#     python cli.py batch somang_cd/ patches/ -o out/ --radius 60 --workers 4
+#     python cli.py dataset somang_cd/ patches/ -o data/ --samples 10000 --seed 1
+#     python cli.py assets somang_cd/
+#     python cli.py serve --port 8000 --workers 4
+
+
+def _open_rgba(path):
+    image = Image.open(path)
+    if image.mode != "RGBA":
+        image = image.convert("RGBA")
+    return image
+
+
+def _find_disc(image):
+    import numpy as np
+    from rotation import detect_disc
+
+    disc = detect_disc(np.asarray(image)[..., 3])
+    if disc is None:
+        raise ValueError("이미지에서 CD 영역(알파 > 0)을 찾을 수 없습니다.")
+    return disc
+
+
+def compose(args):
+    from core import apply_patch, merge_images
+
+    if args.tiled:
+        # 아주 큰 이미지는 파일에서 띠 단위로 읽어 바로 결과 파일에 씀
+        # 입력은 .npy 나 에셋 저장소의 memmap 만 받음 (PNG/JPEG 를 그대로 열면 전체를 디코딩함)
+        from tiled import apply_patch_tiled, open_strip_source, source_size
+
+        background = open_strip_source(args.background)
+        patch = open_strip_source(args.patch)
+        width, height = source_size(background)
+        position = tuple(args.position) if args.position else (width // 2, height // 2)
+        return apply_patch_tiled(background, patch, position, args.radius, args.output,
+                                 strip_height=args.strip_height, antialias=args.antialias)
+
+    background = _open_rgba(args.background)
+    patch = _open_rgba(args.patch)
+    if args.resize:
+        background = background.resize(tuple(args.resize))
+        patch = patch.resize(tuple(args.resize))
+    position = tuple(args.position) if args.position else (background.width // 2, background.height // 2)
+    if args.merge:
+        merged = merge_images(background, patch, position, args.radius, is_transparent=not args.opaque,
+                              key_mode=args.key_mode, antialias=args.antialias)
+    else:
+        disc = _find_disc(background) if args.disc else None
+        merged = apply_patch(background, patch, position, args.radius, disc=disc, antialias=args.antialias)
+    merged.save(args.output)
+    return args.output
+
+
+def rotate(args):
+    from core import rotate_cd, rotate_image
+
+    image = _open_rgba(args.image)
+    patch = _open_rgba(args.patch) if args.patch else None
+    if args.disc or patch is not None:
+        disc = _find_disc(image) if args.disc else None
+        rotated = rotate_cd(image, patch, args.angle, disc=disc)
+    else:
+        rotated = rotate_image(image, args.angle)
+    rotated.save(args.output)
+    return args.output
+
+
+def export(args):
+    from animation import export_spin
+
+    image = _open_rgba(args.image)
+    patch = _open_rgba(args.patch) if args.patch else None
+    disc = _find_disc(image) if args.disc else None
+    export_spin(args.output, image, frames=args.frames, fps=args.fps, size=tuple(args.size) if args.size else None,
+                fmt=args.format, disc=disc, patch=patch, loop=args.loop, clockwise=args.clockwise,
+                optimize=not args.no_optimize, workers=args.workers, rpm=args.rpm, shutter=args.shutter)
+    return args.output
+
+
+def batch(args):
+    from batch import iter_manifest_jobs, iter_pair_jobs, run_batch
+
+    position = tuple(args.position) if args.position else None
+    if args.manifest:
+        jobs = iter_manifest_jobs(args.manifest, args.output, cd_dir=args.cd_dir, patch_dir=args.patch_dir,
+                                  position=position, radius=args.radius)
+    else:
+        if not args.cd_dir or not args.patch_dir:
+            raise ValueError("CD 이미지 폴더와 패치 이미지 폴더를 지정하거나 --manifest 를 사용하세요.")
+        jobs = iter_pair_jobs(args.cd_dir, args.patch_dir, args.output, position=position, radius=args.radius)
+
+    done = failed = 0
+    for job, error in run_batch(jobs, workers=args.workers, max_in_flight=args.max_in_flight,
+                                overwrite=args.overwrite, size=tuple(args.size) if args.size else None,
+                                method="merge" if args.merge else "apply", antialias=args.antialias,
+                                key_mode=args.key_mode):
+        if error is None:
+            done += 1
+            print(job.output)
+        else:
+            failed += 1
+            print(f"실패: {job.background} + {job.patch}: {error}", file=sys.stderr)
+    if failed:
+        raise ValueError(f"{failed}개 작업이 실패했습니다. (성공 {done}개)")
+    return f"완료: {done}개 (이미 있던 결과는 건너뜀)"
+
+
+def dataset(args):
+    from dataset import generate_dataset
+
+    return generate_dataset(args.cd_dir, args.patch_dir, args.output, args.samples, seed=args.seed,
+                            size=tuple(args.size), shard_size=args.shard_size, fmt=args.format,
+                            workers=args.workers)
+
+
+def assets(args):
+    from assets import AssetStore
+
+    store = AssetStore(args.directory, store_dir=args.store)
+    decoded = store.build(workers=args.workers, rebuild=args.rebuild)
+    for name in store.names():
+        info = store.info(name)
+        print(f"{name}\t{info['size'][0]}x{info['size'][1]}\tdisc={info['disc']}\t{info['sha256'][:16]}")
+    return f"{store.index_path} (새로 디코딩 {len(decoded)}개 / 전체 {len(store.names())}개)"
+
+
+def serve(args):
+    from server import serve as run_server
+
+    run_server(args.host, args.port, workers=args.workers, queue_size=args.queue, cache_dir=args.cache_dir,
+               cache_bytes=None if args.cache_mb is None else args.cache_mb << 20)
+    return "서버 종료"
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="cd-rotator", description="CD 이미지 합성/회전 도구")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    p = commands.add_parser("compose", help="배경(CD) 이미지에 패치 이미지를 원형으로 합성")
+    p.add_argument("background")
+    p.add_argument("patch")
+    p.add_argument("-o", "--output", required=True)
+    p.add_argument("--position", type=int, nargs=2, metavar=("X", "Y"), help="붙일 위치 (기본: 배경 중심)")
+    p.add_argument("--radius", type=int, default=50, help="가운데 구멍 반지름")
+    p.add_argument("--resize", type=int, nargs=2, metavar=("W", "H"), help="합성 전에 두 이미지를 이 크기로 맞춤")
+    p.add_argument("--antialias", action="store_true", help="구멍 가장자리를 부드럽게")
+    p.add_argument("--disc", action="store_true", help="배경의 CD 영역만 합성 (알파 채널에서 찾음)")
+    p.add_argument("--merge", action="store_true", help="apply_patch 대신 merge_images 방식으로 합성")
+    p.add_argument("--opaque", action="store_true", help="merge_images 에서 배경 제거를 하지 않음")
+    p.add_argument("--key-mode", choices=["hard", "soft"], default="hard", help="merge_images 배경 제거 방식")
+    p.add_argument("--tiled", action="store_true",
+                   help="띠 단위로 합성해 메모리를 적게 씀 (결과는 .png / .npy, 입력은 .npy 이거나 "
+                        "assets 명령으로 색인한 폴더의 이미지여야 함)")
+    p.add_argument("--strip-height", type=int, default=256, help="--tiled 에서 한 번에 처리할 행 수")
+    p.set_defaults(func=compose)
+
+    p = commands.add_parser("rotate", help="이미지(또는 CD 영역)를 회전")
+    p.add_argument("image")
+    p.add_argument("-o", "--output", required=True)
+    p.add_argument("--angle", type=float, required=True)
+    p.add_argument("--disc", action="store_true", help="CD 영역만 회전 (알파 채널에서 찾음)")
+    p.add_argument("--patch", help="회전 후 (50, 50) 위치에 붙일 이미지 (rotate_cd)")
+    p.set_defaults(func=rotate)
+
+    p = commands.add_parser("export", help="회전 애니메이션 저장 (gif, png/apng, webp, mp4)")
+    p.add_argument("image")
+    p.add_argument("-o", "--output", required=True)
+    p.add_argument("--frames", type=int, default=36)
+    p.add_argument("--fps", type=float, default=24)
+    p.add_argument("--size", type=int, nargs=2, metavar=("W", "H"))
+    p.add_argument("--format", choices=["gif", "apng", "webp", "mp4"], help="기본: 확장자로 결정")
+    p.add_argument("--disc", action="store_true", help="CD 영역만 회전 (알파 채널에서 찾음)")
+    p.add_argument("--patch", help="프레임마다 (50, 50) 위치에 붙일 이미지")
+    p.add_argument("--loop", type=int, default=0)
+    p.add_argument("--clockwise", action="store_true")
+    p.add_argument("--no-optimize", action="store_true", help="바뀐 영역만 기록하는 최적화를 끔")
+    p.add_argument("--workers", type=int, help="프레임을 그릴 프로세스 수")
+    p.add_argument("--rpm", type=float, help="모션 블러용 회전 속도")
+    p.add_argument("--shutter", type=float, help="모션 블러용 셔터 시간(초)")
+    p.set_defaults(func=export)
+
+    p = commands.add_parser("batch", help="폴더(또는 매니페스트)의 CD/패치 이미지를 병렬로 합성")
+    p.add_argument("cd_dir", nargs="?", help="CD(배경) 이미지 폴더")
+    p.add_argument("patch_dir", nargs="?", help="패치 이미지 폴더")
+    p.add_argument("-o", "--output", required=True, help="결과 폴더")
+    p.add_argument("--manifest", help="background,patch[,x,y,radius,output] 열을 가진 CSV (없으면 모든 조합)")
+    p.add_argument("--position", type=int, nargs=2, metavar=("X", "Y"), help="붙일 위치 (기본: 배경 중심)")
+    p.add_argument("--radius", type=int, default=50)
+    p.add_argument("--size", type=int, nargs=2, metavar=("W", "H"), help="합성 전에 배경을 이 크기로 맞춤")
+    p.add_argument("--antialias", action="store_true")
+    p.add_argument("--merge", action="store_true", help="apply_patch 대신 merge_images 방식으로 합성")
+    p.add_argument("--key-mode", choices=["hard", "soft"], default="hard")
+    p.add_argument("--workers", type=int)
+    p.add_argument("--max-in-flight", type=int, help="동시에 처리 중인 최대 작업 수 (기본: workers x 2)")
+    p.add_argument("--overwrite", action="store_true", help="이미 있는 결과도 다시 합성")
+    p.set_defaults(func=batch)
+
+    p = commands.add_parser("dataset", help="무작위 조건으로 합성/회전한 학습용 데이터셋 생성")
+    p.add_argument("cd_dir", help="CD(배경) 이미지 폴더")
+    p.add_argument("patch_dir", help="패치 이미지 폴더")
+    p.add_argument("-o", "--output", required=True, help="샤드와 labels.jsonl 을 쓸 폴더")
+    p.add_argument("--samples", type=int, required=True)
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("--size", type=int, nargs=2, metavar=("W", "H"), default=(256, 256))
+    p.add_argument("--shard-size", type=int, default=1000, help="샤드 하나에 담을 샘플 수")
+    p.add_argument("--format", choices=["npz", "tar"], default="npz")
+    p.add_argument("--workers", type=int)
+    p.set_defaults(func=dataset)
+
+    p = commands.add_parser("assets", help="이미지 폴더를 RGBA .npy 로 미리 디코딩해 색인 (memmap 으로 바로 열림)")
+    p.add_argument("directory", help="CD 이미지 폴더 (예: somang_cd/)")
+    p.add_argument("--store", help="저장 위치 (기본: <폴더>/.assets)")
+    p.add_argument("--workers", type=int)
+    p.add_argument("--rebuild", action="store_true", help="바뀌지 않은 이미지도 다시 디코딩")
+    p.set_defaults(func=assets)
+
+    p = commands.add_parser("serve", help="합성/회전/애니메이션 저장 HTTP 서비스 실행")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8000)
+    p.add_argument("--workers", type=int, help="렌더링 프로세스 수")
+    p.add_argument("--queue", type=int, help="렌더링을 기다릴 수 있는 요청 수 (기본: workers, 넘으면 429)")
+    p.add_argument("--cache-dir", help="결과 캐시 폴더 (기본: .result_cache)")
+    p.add_argument("--cache-mb", type=int, help="결과 캐시 최대 크기 (MB, 기본: 1024)")
+    p.set_defaults(func=serve)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    try:
+        output = args.func(args)
+    except (ValueError, OSError) as e:
+        print(f"오류: {e}", file=sys.stderr)
+        return 1
+    print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,423 @@
+from PIL import Image, ImageDraw
+import os
+import numpy as np
+import math
+import functools
+import collections
+import queue
+import threading
+import traceback
+import uuid
+import warnings
+
+# streamlit 없이 스크립트/워커에서 바로 쓸 수 있는 이미지 처리 함수 모음
+# cv2 를 쓰는 rotation 모듈은 회전이 필요할 때만 불러와 import 시간을 줄임
+
+# 디버그용 중간 이미지 저장 여부 (기본 꺼짐, CD_ROTATOR_DEBUG=1 로 켬)
+DEBUG_IMAGES = os.environ.get("CD_ROTATOR_DEBUG", "0") == "1"
+DEBUG_IMAGE_DIR = os.environ.get("CD_ROTATOR_DEBUG_DIR", "debug_images")
+
+# 구멍 마스크 캐시 한도 (MB, 프로세스마다 따로 가짐)
+HOLE_CACHE_MB = int(os.environ.get("CD_ROTATOR_HOLE_CACHE_MB", "16"))
+
+def _key_thresholds(threshold, tolerance):
+    # 채널별 기준값 = threshold - tolerance (R, G, B 각각)
+    th = np.broadcast_to(np.asarray(threshold, dtype=np.int16), (3,))
+    tol = np.broadcast_to(np.asarray(tolerance, dtype=np.int16), (3,))
+    return np.clip(th - tol, 0, 255).astype(np.uint8)
+
+@functools.lru_cache(maxsize=4)
+def _soft_key_cube(key_color, key_range):
+    # 채널별 256 크기 LUT: (값 - 키 색상)^2
+    values = np.arange(256, dtype=np.int32)
+    lut_r, lut_g, lut_b = ((values - int(k)) ** 2 for k in key_color)
+
+    # 거리^2 -> 알파 비율(0~255) LUT
+    # inner 이하: 완전 투명, outer 이상: 원래 알파 유지, 그 사이: 선형 보간
+    inner, outer = key_range
+    distance = np.sqrt(np.arange(3 * 255 ** 2 + 1, dtype=np.float32))
+    ramp = np.clip((distance - inner) / max(outer - inner, 1e-6), 0.0, 1.0)
+    alpha_lut = np.round(ramp * 255).astype(np.uint8)
+
+    # 256^3 색상 큐브 (16MB): 인덱스 = r | g << 8 | b << 16
+    # 픽셀당 테이블 조회 한 번으로 알파 비율을 얻기 위해 키 색상별로 한 번만 만들어 둠
+    cube = alpha_lut[lut_b[:, None, None] + lut_g[None, :, None] + lut_r[None, None, :]]
+    cube = cube.ravel()
+    cube.flags.writeable = False
+    return cube
+
+def remove_background(patch_image, threshold=200, tolerance=0, mode="hard",
+                      key_color=(255, 255, 255), key_range=(50, 100)):
+    # Patch 이미지를 RGBA 형식으로 변환한 뒤 numpy 배열로 가져옴 (H x W x 4)
+    # 이미 RGBA 라면 convert 로 인한 불필요한 복사를 생략
+    if patch_image.mode != "RGBA":
+        patch_image = patch_image.convert("RGBA")
+    patch_array = np.array(patch_image)
+    key_background(patch_array, threshold=threshold, tolerance=tolerance, mode=mode,
+                   key_color=key_color, key_range=key_range)
+    return Image.fromarray(patch_array, "RGBA")
+
+def key_background(patch_array, threshold=200, tolerance=0, mode="hard",
+                   key_color=(255, 255, 255), key_range=(50, 100)):
+    # remove_background 의 배열 버전: H x W x 4 (RGBA uint8, C-contiguous) 배열의 알파만 직접 수정
+    if mode == "soft":
+        # 키 색상과의 거리에 따라 알파를 단계적으로 줄임 (가장자리 부드럽게)
+        cube = _soft_key_cube(tuple(key_color), tuple(key_range))
+        # RGBA 4바이트를 little-endian uint32 로 보고 알파 바이트를 제거하면 큐브 인덱스가 됨
+        rgb_index = patch_array.view("<u4")[..., 0] & 0xFFFFFF
+        alpha = cube[rgb_index].astype(np.uint16)
+        alpha *= patch_array[..., 3]
+        alpha += 127
+        alpha //= 255
+        patch_array[..., 3] = alpha
+        return patch_array
+    if mode != "hard":
+        raise ValueError(f"지원하지 않는 배경 제거 모드입니다: {mode}")
+
+    # 채널별 기준값보다 밝은 픽셀을 배경(흰색)으로 판단
+    # 기본값(threshold=200, tolerance=0)은 r > 200 and g > 200 and b > 200 과 동일
+    th_r, th_g, th_b = _key_thresholds(threshold, tolerance)
+    background = patch_array[..., 0] > th_r
+    background &= patch_array[..., 1] > th_g
+    background &= patch_array[..., 2] > th_b
+
+    # 배경 부분의 알파값만 0으로 만들어 투명하게 처리
+    patch_array[..., 3][background] = 0
+    return patch_array
+
+def rotate_cd(cd_image, patch_image, angle, disc=None, spinner=None):
+    if spinner is not None:
+        # 미리 준비한 DiscSpinner 의 정적 배경 위에 회전하는 CD 층만 다시 그림 (각도 슬라이더용)
+        # (원본은 spinner 가 이미 갖고 있으므로 cd_image 를 다시 배열로 바꾸지 않음)
+        rotated_cd_array = spinner.render(angle).copy()
+        if patch_image is not None:
+            _paste_at(rotated_cd_array, np.asarray(patch_image), (50, 50))
+    else:
+        # CD 이미지를 numpy 배열로 변환해 회전 (patch 는 회전된 CD 의 (50, 50) 위치에 적용)
+        patch_array = None if patch_image is None else np.asarray(patch_image)
+        rotated_cd_array = rotate_cd_array(np.asarray(cd_image), angle, patch_array=patch_array, disc=disc)
+    
+    # 회전된 배열을 이미지로 변환
+    rotated_cd_image = Image.fromarray(rotated_cd_array)
+    
+    return rotated_cd_image
+
+def _paste_at(array, patch_array, offset):
+    x, y = offset
+    array[y:y+patch_array.shape[0], x:x+patch_array.shape[1]] = patch_array
+    return array
+
+def rotate_cd_array(cd_array, angle, patch_array=None, disc=None, out=None):
+    # rotate_cd 의 배열 버전
+    # disc 가 있으면 out 에 바로 그리며 out 이 cd_array 와 같은 버퍼여도 됨 (제자리 회전)
+    # disc 가 없으면 전체를 회전하므로 out 은 cd_array 와 다른 버퍼여야 함
+    from rotation import DiscSpinner, rotate_array
+
+    if disc is None:
+        if out is cd_array:
+            raise ValueError("전체 회전은 원본과 다른 출력 버퍼가 필요합니다.")
+        # 회전 중심점 계산
+        center = (cd_array.shape[1] // 2, cd_array.shape[0] // 2)
+
+        # CD 이미지를 회전시킴 (rotation 엔진의 warpAffine)
+        rotated_cd_array = rotate_array(cd_array, angle, center=center, out=out)
+    else:
+        # CD 원 영역(disc)만 회전하고 나머지는 그대로 둠
+        if out is None:
+            out = cd_array.copy()
+        elif out is not cd_array:
+            np.copyto(out, cd_array)
+        rotated_cd_array = DiscSpinner(cd_array, disc=disc).render(angle, out=out)
+
+    # Patch 이미지를 CD 이미지에 적용
+    if patch_array is not None:
+        _paste_at(rotated_cd_array, patch_array, (50, 50))
+    return rotated_cd_array
+
+def rotate_image(image, angle):
+    # 이미지를 numpy 배열로 변환해 회전한 뒤 다시 이미지로 변환
+    rotated_image = Image.fromarray(rotate_image_array(np.asarray(image), angle))
+    
+    return rotated_image
+
+def rotate_image_array(image_array, angle, out=None):
+    # rotate_image 의 배열 버전 (out 은 image_array 와 다른 버퍼여야 함)
+    from rotation import rotate_array
+
+    # 회전 중심점 계산
+    center = (image_array.shape[1] / 2, image_array.shape[0] / 2)
+    
+    # 이미지를 회전시킴
+    return rotate_array(image_array, angle, center=center, out=out)
+
+def rotate_image_batch(image, angles):
+    from rotation import rotate_batch
+
+    # 같은 이미지를 여러 각도로 한 번에 회전 (원본 배열 변환은 한 번만)
+    image_array = np.asarray(image)
+    center = (image_array.shape[1] / 2, image_array.shape[0] / 2)
+    return [Image.fromarray(frame) for frame in rotate_batch(image_array, angles, center=center)]
+
+def merge_images(background_image, patch_image, position, radius, is_transparent=True,
+                 key_mode="hard", antialias=False):
+    # 이미지를 원의 크기에 맞게 자르기 (캐시된 마스크 사용, 넘겨받은 패치는 수정하지 않음)
+    # 구멍/배경 제거/붙이기는 배열 하나에서 처리 (merge_arrays)
+    merged = merge_arrays(_rgba_array(background_image), _rgba_array(patch_image), position, radius,
+                          is_transparent=is_transparent, key_mode=key_mode, antialias=antialias,
+                          inplace_patch=True)
+    return Image.fromarray(merged, "RGBA")
+
+def merge_arrays(bg_array, patch_array, position, radius, is_transparent=True, key_mode="hard",
+                 antialias=False, out=None, inplace_patch=False):
+    # merge_images 의 배열 버전 (H x W x 4 RGBA uint8)
+    # out 이 bg_array 면 배경 버퍼에 바로 합성, inplace_patch=True 면 패치 버퍼도 직접 수정 (복사 생략)
+    if not inplace_patch:
+        patch_array = patch_array.copy()
+    cut_hole(patch_array, radius, antialias=antialias)
+    if is_transparent:
+        key_background(patch_array, mode=key_mode)
+
+    if out is None:
+        out = bg_array.copy()
+    elif out is not bg_array:
+        np.copyto(out, bg_array)
+
+    # 원의 중심을 기준으로 merge (PIL paste(patch, pos, patch) 와 같이 패치 알파 비율로 덮어씀)
+    p_h, p_w = patch_array.shape[:2]
+    h, w = out.shape[:2]
+    o_x, o_y = position[0] - p_w // 2, position[1] - p_h // 2
+    x0, x1 = max(0, o_x), min(w, o_x + p_w)
+    y0, y1 = max(0, o_y), min(h, o_y + p_h)
+    if x0 < x1 and y0 < y1:
+        src = patch_array[y0 - o_y:y1 - o_y, x0 - o_x:x1 - o_x]
+        _blend_patch(out[y0:y1, x0:x1], src, src[..., 3])
+    return out
+
+def _rgba_array(image):
+    # 이미 RGBA 라면 convert 로 인한 복사 없이 바로 배열로 변환
+    if image.mode != "RGBA":
+        image = image.convert("RGBA")
+    return np.array(image)
+
+def _soft_hole(mask, center, axes):
+    # 타원 경계까지의 거리(근사 거리장)로 픽셀이 구멍에 덮이는 비율을 계산해 가장자리를 부드럽게 함
+    # ImageDraw.ellipse 와 같은 모양이 되도록 픽셀 중심 기준 반지름은 반 픽셀 크게 잡음
+    c_x, c_y = center
+    a, b = axes[0] + 0.5, axes[1] + 0.5
+    h, w = mask.shape
+    y0, y1 = max(0, int(c_y - b) - 1), min(h, int(math.ceil(c_y + b)) + 2)
+    x0, x1 = max(0, int(c_x - a) - 1), min(w, int(math.ceil(c_x + a)) + 2)
+    dy = np.arange(y0, y1, dtype=np.float32)[:, None] - c_y
+    dx = np.arange(x0, x1, dtype=np.float32)[None, :] - c_x
+    f = (dx / a) ** 2 + (dy / b) ** 2 - 1
+    grad = 2 * np.sqrt((dx / (a * a)) ** 2 + (dy / (b * b)) ** 2)
+    distance = f / np.maximum(grad, 1e-6)
+    mask[y0:y1, x0:x1] = np.rint(255 * np.clip(0.5 + distance, 0, 1)).astype(np.uint8)
+    return mask
+
+def _ellipse_mask(size, center, axes, antialias=False):
+    # center 를 중심으로 반지름 axes 인 타원 영역만 0 인 마스크 (나머지는 255)
+    # antialias=True 면 경계 픽셀이 0~255 사이 값을 가짐 (타원 사각형 밖 1픽셀까지)
+    p_w, p_h = size
+    c_x, c_y = center
+    c_w, c_h = axes
+    if antialias and c_w > 0 and c_h > 0:
+        return _soft_hole(np.full((p_h, p_w), 255, dtype=np.uint8), (c_x, c_y), (c_w, c_h))
+    mask = Image.new('L', size, 255)
+    draw = ImageDraw.Draw(mask)
+    draw.ellipse((c_x - c_w, c_y - c_h, c_x + c_w, c_y + c_h), fill=0)
+    return np.array(mask)
+
+_hole_cache = collections.OrderedDict()  # (반지름, antialias) -> 마스크, 오래 안 쓴 순서
+_hole_cache_bytes = 0
+_hole_cache_lock = threading.Lock()
+
+def _hole_crop(axes, antialias=False):
+    # 구멍을 감싸는 사각형(가장자리 1픽셀 여유 포함)만큼의 마스크, 반지름별로 캐시해 요청 사이에 재사용 (읽기 전용)
+    # 캔버스 크기와 관계없이 (2r+3)^2 바이트이고, 전체가 HOLE_CACHE_MB 를 넘으면 오래 안 쓴 것부터 버림
+    global _hole_cache_bytes
+    key = (axes, antialias)
+    with _hole_cache_lock:
+        mask = _hole_cache.get(key)
+        if mask is not None:
+            _hole_cache.move_to_end(key)
+            return mask
+    c_w, c_h = axes
+    mask = _ellipse_mask((2 * c_w + 3, 2 * c_h + 3), (c_w + 1, c_h + 1), (c_w, c_h), antialias)
+    mask.flags.writeable = False
+    limit = HOLE_CACHE_MB << 20
+    if mask.nbytes > limit:
+        return mask
+    with _hole_cache_lock:
+        if key not in _hole_cache:
+            _hole_cache[key] = mask
+            _hole_cache_bytes += mask.nbytes
+        while _hole_cache_bytes > limit:
+            _, old = _hole_cache.popitem(last=False)
+            _hole_cache_bytes -= old.nbytes
+    return mask
+
+def _hole_mask(size, radius, antialias=False):
+    # 가운데 원 영역만 0 인 마스크 (나머지는 255)
+    # 캐시해 둔 구멍 부분만 붙이고 나머지는 255 로 채움 (결과는 호출마다 새 배열)
+    # antialias=True 면 경계 픽셀이 0~255 사이 값을 가짐 (composite_patch 가 비율대로 섞음)
+    p_w, p_h = size
+    c_w, c_h = min(radius, p_w // 2), min(radius, p_h // 2)
+    hole = _hole_crop((c_w, c_h), antialias)
+    mask = np.full((p_h, p_w), 255, dtype=np.uint8)
+    x0, y0 = p_w // 2 - c_w - 1, p_h // 2 - c_h - 1
+    hx, hy = max(0, -x0), max(0, -y0)
+    x1, y1 = min(p_w, x0 + hole.shape[1]), min(p_h, y0 + hole.shape[0])
+    mask[y0 + hy:y1, x0 + hx:x1] = hole[hy:hy + y1 - y0 - hy, hx:hx + x1 - x0 - hx]
+    return mask
+
+def cut_hole(patch_array, radius, antialias=False):
+    # make_hole 의 배열 버전: 알파 채널을 구멍 마스크로 바꿈 (배열을 직접 수정)
+    p_h, p_w = patch_array.shape[:2]
+    patch_array[..., 3] = _hole_mask((p_w, p_h), radius, antialias)
+    return patch_array
+
+def make_hole(patch_image, radius, antialias=False):
+    # 이미지를 원의 크기에 맞게 자르기
+    mask = _hole_mask(patch_image.size, radius, antialias)
+    patch_image.putalpha(Image.fromarray(mask, "L"))
+    return patch_image
+
+def composite_patch(bg_array, patch_array, position, hole_mask, out=None, disc=None):
+    # bg_array, patch_array: 같은 크기의 H x W x 4 (RGBA uint8) 배열
+    # hole_mask: H x W (uint8) 구멍 마스크, out: 결과를 쓸 미리 할당된 H x W x 4 배열 (없으면 새로 할당)
+    # disc: 배경의 CD 영역 (cx, cy, r), 주면 그 원을 감싸는 사각형 안에서만 합성
+    # make_hole -> 배경 알파 마스크 -> composite -> paste 과정을 중간 이미지 없이 한 번에 처리
+    h, w = bg_array.shape[:2]
+
+    # 배경 알파가 0 인 곳은 결과가 바뀌지 않으므로 CD 영역(패치 좌표 = 배경 좌표)만 대상으로 삼음
+    if disc is None:
+        s_x0, s_y0, s_x1, s_y1 = 0, 0, w, h
+    else:
+        from rotation import disc_bbox
+        s_x0, s_y0, s_x1, s_y1 = disc_bbox(disc, (w, h))
+
+    # 원의 중심을 기준으로 붙일 위치(좌상단)를 계산하고, 배경 밖으로 나가는 부분은 잘라냄
+    o_x, o_y = position[0] - w // 2, position[1] - h // 2
+    x0, x1 = max(0, o_x + s_x0), min(w, o_x + s_x1)
+    y0, y1 = max(0, o_y + s_y0), min(h, o_y + s_y1)
+    if x0 < x1 and y0 < y1:
+        src = (slice(y0 - o_y, y1 - o_y), slice(x0 - o_x, x1 - o_x))
+        # 패치의 알파 = 구멍 마스크, 단 배경 알파가 0 인 곳(색상 없는 부분)은 투명
+        # (out 이 bg_array 와 같은 버퍼일 수 있으므로 덮어쓰기 전에 계산)
+        mask = hole_mask[src] * (bg_array[src][..., 3] > 0)
+    else:
+        mask = None
+
+    if out is None:
+        out = bg_array.copy()
+    elif out is not bg_array:
+        np.copyto(out, bg_array)
+    if mask is None:
+        return out
+
+    _blend_patch(out[y0:y1, x0:x1], patch_array[src], mask)
+    return out
+
+def _blend_patch(dst, patch_src, mask):
+    # dst 위에 patch_src 를 mask(0~255) 비율로 덮어씀 (dst 를 직접 수정)
+    # 마스크가 255 인 곳은 패치 픽셀로 그대로 교체 (RGBA 4바이트를 uint32 하나로 복사)
+    opaque = mask == 255
+    np.copyto(dst.view(np.uint32)[..., 0], patch_src.view(np.uint32)[..., 0], where=opaque)
+    dst[..., 3][opaque] = 255
+
+    # 마스크가 0 과 255 사이인 곳만 PIL paste 와 같은 방식(반올림 포함)으로 블렌딩
+    partial = mask != 0
+    partial &= ~opaque
+    if partial.any():
+        m = mask[partial].astype(np.uint32)[:, None]
+        fg = np.empty((m.shape[0], 4), dtype=np.uint32)
+        fg[:, :3] = patch_src[..., :3][partial]
+        fg[:, 3:] = m
+        blended = fg * m + dst[partial] * (255 - m) + 128
+        dst[partial] = (blended + (blended >> 8)) >> 8
+    return dst
+
+class DebugImageWriter:
+    # 디버그 이미지를 백그라운드 스레드에서 인코딩/저장
+    # 큐가 가득 차면 기다리지 않고 해당 요청의 디버그 이미지를 버림
+    def __init__(self, maxsize=4):
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, func, *args):
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait((func, args))
+        except queue.Full:
+            warnings.warn("디버그 이미지 저장 대기열이 가득 차서 건너뜁니다.", RuntimeWarning, stacklevel=2)
+            return False
+        return True
+
+    def join(self):
+        # 대기 중인 저장 작업이 모두 끝날 때까지 기다림 (테스트/종료용)
+        self._queue.join()
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="debug-image-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            func, args = self._queue.get()
+            try:
+                func(*args)
+            except Exception:
+                traceback.print_exc()
+            finally:
+                self._queue.task_done()
+
+_debug_writer = DebugImageWriter()
+
+def _save_debug_images(background_image, patch_image, radius, prefix, antialias=False):
+    # 단계별 중간 결과를 파일로 저장 (디버깅용)
+    # prefix: 세션/요청별 파일 이름 앞부분 (예: debug_images/<session>/<request>_)
+    os.makedirs(os.path.dirname(prefix) or ".", exist_ok=True)
+    patch_image = make_hole(patch_image.copy(), radius, antialias=antialias)
+    patch_image.save(f"{prefix}0.hole.png")
+
+    # 배경 이미지의 알파 채널을 분리합니다.
+    bg_alpha = background_image.split()[3]
+    bg_alpha.save(f"{prefix}1.bg_alpha.png")
+ 
+    # 배경 이미지의 색상 있는 부분을 마스크로 만듭니다.
+    bg_mask = bg_alpha.point(lambda p: 255 if p > 0 else 0)
+    bg_mask.save(f"{prefix}2.bg_mask.png")
+
+    # 배경 이미지의 색상 없는 부분을 반전한 마스크로 만듭니다.
+    bg_mask_inv = bg_mask.point(lambda p: 255 - p)
+    bg_mask_inv.save(f"{prefix}3.bg_mask_inv.png")
+
+    # 패치 이미지를 배경 이미지의 색상 있는 부분에만 적용
+    patch_applied = Image.composite(patch_image, Image.new("RGBA", patch_image.size, (0, 0, 0, 0)), bg_mask)
+    patch_applied.save(f"{prefix}4.patch_applied.png")
+
+    # 배경 이미지의 색상 없는 부분은 투명하게 처리
+    transparent_patch = Image.composite(Image.new("RGBA", patch_image.size, (0, 0, 0, 0)), patch_image, bg_mask_inv)
+    transparent_patch.save(f"{prefix}5.transparent_patch.png")
+
+def apply_patch(background_image, patch_image, position, radius, debug=None, session_id="default",
+                disc=None, antialias=False):
+    # 이미지 크기 확인
+    if background_image.size != patch_image.size:
+        raise ValueError("배경 이미지와 패치 이미지는 같은 크기여야 합니다.")
+
+    # 디버그 모드일 때만 중간 이미지를 세션/요청별 이름으로 백그라운드에서 저장
+    if DEBUG_IMAGES if debug is None else debug:
+        prefix = os.path.join(DEBUG_IMAGE_DIR, session_id, f"{uuid.uuid4().hex[:8]}_")
+        _debug_writer.submit(_save_debug_images, background_image, patch_image, radius, prefix, antialias)
+
+    # 배경/패치를 RGBA 배열로 가져와 한 번에 합성
+    bg_array = _rgba_array(background_image)
+    patch_array = _rgba_array(patch_image)
+    hole_mask = _hole_mask(patch_image.size, radius, antialias)
+    merged_array = composite_patch(bg_array, patch_array, position, hole_mask, out=bg_array, disc=disc)
+    return Image.fromarray(merged_array, "RGBA")
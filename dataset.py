@@ -0,0 +1,153 @@
+import concurrent.futures
+import functools
+import io
+import json
+import os
+import tarfile
+
+import numpy as np
+from PIL import Image
+
+from assets import load_asset
+from batch import list_images
+from core import apply_patch, rotate_cd
+
+
+# 샘플링 범위 기본값
+DEFAULT_RANGES = {
+    "angle": (0.0, 360.0),
+    "offset": (-0.1, 0.1),  # 붙일 위치의 중심에서 벗어나는 정도 (이미지 크기 비율)
+    "radius": (0.05, 0.2),  # 가운데 구멍 반지름 (이미지 크기 비율)
+    "scale": (0.6, 1.0),  # 패치 크기 배율 (배경 크기 기준)
+}
+
+
+@functools.lru_cache(maxsize=64)
+def _load_background(path, size):
+    # 워커마다 배경(CD) 이미지는 크기별로 한 번만 디코딩/리사이즈하고 CD 영역도 한 번만 찾음
+    # 에셋 저장소(assets.py)가 있으면 디코딩 대신 .npy memmap 에서 읽음
+    from rotation import detect_disc
+
+    array, _ = load_asset(path)
+    background = Image.fromarray(np.asarray(array), "RGBA").resize(size, Image.BILINEAR)
+    disc = detect_disc(np.asarray(background)[..., 3])
+    return background, disc
+
+
+@functools.lru_cache(maxsize=64)
+def _load_patch(path):
+    return Image.open(path).convert("RGBA")
+
+
+def _fit_patch(patch, background, scale):
+    # 패치를 배경 크기 x scale 로 줄여 배경 사본 가운데에 얹음 (apply_patch 는 같은 크기가 필요)
+    # apply_patch 는 패치 픽셀을 불투명하게 덮어쓰므로 남는 부분은 투명 대신 배경으로 채움
+    width, height = background.size
+    scaled = patch.resize((max(1, round(width * scale)), max(1, round(height * scale))), Image.BILINEAR)
+    canvas = background.copy()
+    canvas.alpha_composite(scaled, ((width - scaled.width) // 2, (height - scaled.height) // 2))
+    return canvas
+
+
+def sample_params(seed, index, backgrounds, patches, size, ranges=None):
+    # 샘플 하나의 합성 조건
+    # (seed, index) 로 난수 생성기를 따로 만들어 워커 수/처리 순서와 관계없이 같은 샘플이 나옴
+    ranges = dict(DEFAULT_RANGES, **(ranges or {}))
+    rng = np.random.default_rng([seed, index])
+    width, height = size
+    short = min(width, height)
+    offset_x, offset_y = rng.uniform(*ranges["offset"], size=2)
+    return {
+        "index": index,
+        "background": backgrounds[rng.integers(len(backgrounds))],
+        "patch": patches[rng.integers(len(patches))],
+        "angle": round(float(rng.uniform(*ranges["angle"])), 3),
+        "position": [int(width // 2 + round(offset_x * width)), int(height // 2 + round(offset_y * height))],
+        "radius": int(round(rng.uniform(*ranges["radius"]) * short)),
+        "scale": round(float(rng.uniform(*ranges["scale"])), 4),
+    }
+
+
+def render_sample(params, size):
+    # 패치를 합성한 뒤 CD 영역을 회전 (라벨 패치도 CD 와 함께 돎)
+    background, disc = _load_background(params["background"], size)
+    patch = _fit_patch(_load_patch(params["patch"]), background, params["scale"])
+    merged = apply_patch(background, patch, tuple(params["position"]), params["radius"], debug=False, disc=disc)
+    if disc is None:
+        return np.asarray(merged)
+    return np.asarray(rotate_cd(merged, None, params["angle"], disc=disc))
+
+
+def _init_worker():
+    # 프로세스마다 샤드 하나씩 맡으므로 cv2 내부 스레드는 쓰지 않음
+    import cv2
+    cv2.setNumThreads(1)
+
+
+def _shard_name(shard, fmt):
+    return f"shard-{shard:05d}.{'npz' if fmt == 'npz' else 'tar'}"
+
+
+def write_shard(output_dir, shard, samples, size, fmt="npz"):
+    # 샘플 묶음 하나를 그려 샤드 파일 하나로 저장 (프로세스 풀 워커에서 실행)
+    # npz: images (N, H, W, 4) uint8 배열 + index, tar: 샘플별 PNG
+    name = _shard_name(shard, fmt)
+    path = os.path.join(output_dir, name)
+    partial = os.path.join(output_dir, f".{name}.part")
+    labels = []
+    if fmt == "npz":
+        images = np.empty((len(samples), size[1], size[0], 4), dtype=np.uint8)
+        for i, params in enumerate(samples):
+            images[i] = render_sample(params, size)
+            labels.append(dict(params, shard=name, key=i))
+        with open(partial, "wb") as f:
+            np.savez(f, images=images, index=np.array([p["index"] for p in samples], dtype=np.int64))
+    elif fmt == "tar":
+        with tarfile.open(partial, "w") as tar:
+            for params in samples:
+                buffer = io.BytesIO()
+                Image.fromarray(render_sample(params, size), "RGBA").save(buffer, format="PNG", compress_level=1)
+                key = f"{params['index']:08d}.png"
+                info = tarfile.TarInfo(key)
+                info.size = buffer.tell()
+                buffer.seek(0)
+                tar.addfile(info, buffer)
+                labels.append(dict(params, shard=name, key=key))
+    else:
+        raise ValueError(f"지원하지 않는 샤드 형식입니다: {fmt} (npz, tar)")
+    os.replace(partial, path)
+    return labels
+
+
+def generate_dataset(cd_dir, patch_dir, output_dir, samples, seed=0, size=(256, 256), shard_size=1000,
+                     fmt="npz", workers=None, ranges=None):
+    # 합성 데이터셋 생성: 샤드 파일들 + 샘플 순서대로 정렬된 labels.jsonl
+    # 샤드 하나가 작업 하나이며, 라벨은 샤드 번호 순서대로 기록하므로 같은 seed 면 결과 파일이 같음
+    backgrounds = list_images(cd_dir)
+    patches = list_images(patch_dir)
+    if not backgrounds or not patches:
+        raise ValueError("CD 이미지 폴더와 패치 이미지 폴더에 이미지가 있어야 합니다.")
+    size = tuple(size)
+    workers = workers or os.cpu_count() or 1
+    os.makedirs(output_dir, exist_ok=True)
+
+    def shard_samples(shard):
+        start = shard * shard_size
+        return [sample_params(seed, i, backgrounds, patches, size, ranges)
+                for i in range(start, min(samples, start + shard_size))]
+
+    shard_count = (samples + shard_size - 1) // shard_size
+    labels_path = os.path.join(output_dir, "labels.jsonl")
+    with open(labels_path, "w", encoding="utf-8") as labels_file, \
+            concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        # 동시에 제출하는 샤드 수를 제한해 끝난 샤드의 라벨이 메모리에 쌓이지 않게 함
+        pending = {}
+        next_shard = 0
+        for shard in range(shard_count):
+            while next_shard < shard_count and len(pending) < workers * 2:
+                pending[next_shard] = executor.submit(write_shard, output_dir, next_shard,
+                                                      shard_samples(next_shard), size, fmt)
+                next_shard += 1
+            for label in pending.pop(shard).result():
+                labels_file.write(json.dumps(label, ensure_ascii=False) + "\n")
+    return labels_path
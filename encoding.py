@@ -0,0 +1,69 @@
+import io
+
+import cv2
+import numpy as np
+from PIL import Image
+
+
+# 이미지를 파일 대신 메모리 버퍼로 인코딩 (웹 UI 다운로드 / 화면 표시용)
+# 형식 이름 -> (확장자, MIME 타입)
+FORMATS = {
+    "PNG": ("png", "image/png"),
+    "JPEG": ("jpg", "image/jpeg"),
+    "WEBP": ("webp", "image/webp"),
+}
+
+
+def flatten(image, background=(255, 255, 255)):
+    # 투명한 부분을 background 색으로 채운 RGB 이미지 (JPEG 는 알파 채널을 저장할 수 없음)
+    if image.mode == "RGB":
+        return image
+    if image.mode not in ("RGBA", "LA") and "transparency" not in image.info:
+        return image.convert("RGB")
+    rgba = image.convert("RGBA")
+    canvas = Image.new("RGB", rgba.size, background)
+    canvas.paste(rgba, mask=rgba.getchannel("A"))
+    return canvas
+
+
+def encode_image(image, fmt="PNG", quality=90, compress_level=6, lossless=False, background=(255, 255, 255),
+                 method=4):
+    # fmt: PNG (compress_level 0~9), JPEG (quality, 투명한 부분은 background 로 채움), WEBP (lossless 또는 quality)
+    fmt = fmt.upper()
+    buffer = io.BytesIO()
+    if fmt == "PNG":
+        image.save(buffer, format="PNG", compress_level=compress_level)
+    elif fmt == "JPEG":
+        flatten(image, background).save(buffer, format="JPEG", quality=quality)
+    elif fmt == "WEBP":
+        image.save(buffer, format="WEBP", lossless=lossless, quality=100 if lossless else quality, method=method)
+    else:
+        raise ValueError(f"지원하지 않는 저장 형식입니다: {fmt} ({', '.join(FORMATS)})")
+    return buffer.getvalue()
+
+
+def encode_preview(image, max_side=1024, fmt="WEBP", quality=80):
+    # 화면 표시용: 긴 변이 max_side 이하가 되도록 줄인 뒤 손실 압축 (WEBP 는 투명도 유지, JPEG 는 흰 배경)
+    scale = max_side / max(image.size)
+    if scale < 1:
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        image = image.resize(size, Image.BILINEAR, reducing_gap=2.0)
+    return encode_image(image, fmt, quality=quality, method=2)
+
+
+def encode_frame(image, max_side=1024, quality=75):
+    # 회전 슬라이더처럼 값마다 한 번만 보내는 화면용: 선형 보간으로 빠르게 줄인 뒤 JPEG (투명한 부분은 흰 배경)
+    # 2000x2000 에서도 수십 ms 안에 끝나도록 encode_preview 의 고품질 축소와 WEBP 압축은 쓰지 않음
+    scale = max_side / max(image.size)
+    if scale < 1:
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        image = Image.fromarray(cv2.resize(np.asarray(image), size, interpolation=cv2.INTER_LINEAR), image.mode)
+    return encode_image(image, "JPEG", quality=quality)
+
+
+def file_extension(fmt):
+    return FORMATS[fmt.upper()][0]
+
+
+def mime_type(fmt):
+    return FORMATS[fmt.upper()][1]
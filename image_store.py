@@ -0,0 +1,219 @@
+import collections
+import hashlib
+import io
+import itertools
+import threading
+import weakref
+
+from PIL import Image
+
+
+# 여러 세션이 함께 쓰는 이미지 저장소 (웹 UI 의 session_state 에는 이미지 대신 이름 -> 키 핸들만 둠)
+# 같은 키(내용 해시)의 이미지는 세션 수와 관계없이 한 번만 보관하고 참조 수로 관리함
+# 바이트 한도를 넘으면 오래 안 쓴 이미지부터
+#   1) 어떤 세션도 참조하지 않는 이미지는 버리고
+#   2) 참조 중인 이미지는 PNG(무손실)로 압축해 두었다가 다시 꺼낼 때 디코딩함
+# 저장소에서 꺼낸 이미지는 다른 세션과 같은 객체이므로 수정하면 안 됨
+
+
+def image_nbytes(image):
+    return image.width * image.height * len(image.getbands())
+
+
+def image_digest(image):
+    # 키를 따로 주지 않았을 때 쓰는 내용 해시 (모드/크기 포함)
+    digest = hashlib.sha256(f"{image.mode}:{image.width}x{image.height}:".encode("ascii"))
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+class _Entry:
+    __slots__ = ("image", "packed", "nbytes", "refs")
+
+    def __init__(self, image):
+        self.image = image
+        self.packed = None  # 압축해 둔 PNG 바이트 (image 가 None 일 때만 있음)
+        self.nbytes = image_nbytes(image)
+        self.refs = set()  # 이 이미지를 가진 세션 id
+
+    @property
+    def size(self):
+        # 지금 차지하는 바이트 (압축돼 있으면 압축된 크기)
+        return self.nbytes if self.image is not None else len(self.packed)
+
+    def pack(self):
+        buffer = io.BytesIO()
+        self.image.save(buffer, format="PNG", compress_level=1)
+        self.packed = buffer.getvalue()
+        self.image = None
+
+    def unpack(self):
+        image = Image.open(io.BytesIO(self.packed))
+        image.load()
+        self.image = image
+        self.packed = None
+        return image
+
+
+class ImageStore:
+    # max_bytes: 전체 한도, session_bytes: 세션 하나가 압축하지 않은 채로 가질 수 있는 한도
+    def __init__(self, max_bytes, session_bytes):
+        self.max_bytes = max_bytes
+        self.session_bytes = session_bytes
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()  # 키 -> _Entry, 오래 안 쓴 순서
+        self._sessions = {}  # 세션 id -> {이름: 키}
+        self._ids = itertools.count()
+        # 끝난 세션 id (GC 중에 불리는 finalize 에서는 잠금을 잡지 않고 여기에만 넣음)
+        self._closed = collections.deque()
+
+    def session(self):
+        # 세션마다 하나씩 만들어 session_state 에 두는 핸들
+        # 핸들이 사라지면(세션 종료) 그 세션의 참조를 모두 돌려줌
+        with self._lock:
+            session_id = next(self._ids)
+            self._sessions[session_id] = {}
+        return SessionImages(self, session_id)
+
+    def _release_closed(self):
+        # 잠금을 잡은 상태에서 호출, 끝난 세션의 참조를 돌려줌
+        while self._closed:
+            session_id = self._closed.popleft()
+            for key in self._sessions.pop(session_id, {}).values():
+                self._unref(key, session_id)
+
+    def _unref(self, key, session_id):
+        entry = self._entries.get(key)
+        if entry is None:
+            return
+        slots = self._sessions.get(session_id, {})
+        if key not in slots.values():
+            entry.refs.discard(session_id)
+
+    def _session_usage(self, session_id):
+        keys = set(self._sessions[session_id].values())
+        return sum(self._entries[key].nbytes for key in keys if self._entries[key].image is not None)
+
+    def _enforce_session(self, session_id, keep):
+        # 세션 한도를 넘으면 그 세션이 가진 이미지 중 오래 안 쓴 것부터 압축
+        usage = self._session_usage(session_id)
+        keys = set(self._sessions[session_id].values())
+        for key, entry in list(self._entries.items()):
+            if usage <= self.session_bytes:
+                break
+            if key in keys and key != keep and entry.image is not None:
+                entry.pack()
+                usage -= entry.nbytes
+
+    def _enforce_global(self, keep=None):
+        total = sum(entry.size for entry in self._entries.values())
+        # 참조가 없는 이미지부터 버림
+        for key, entry in list(self._entries.items()):
+            if total <= self.max_bytes:
+                return
+            if not entry.refs and key != keep:
+                total -= entry.size
+                del self._entries[key]
+        # 그래도 넘으면 참조 중인 이미지를 오래 안 쓴 것부터 압축
+        for key, entry in list(self._entries.items()):
+            if total <= self.max_bytes:
+                return
+            if key != keep and entry.image is not None:
+                before = entry.size
+                entry.pack()
+                total -= before - entry.size
+
+    def _set(self, session_id, name, image, key):
+        with self._lock:
+            self._release_closed()
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry(image)
+            self._entries.move_to_end(key)
+            slots = self._sessions[session_id]
+            old = slots.get(name)
+            slots[name] = key
+            entry.refs.add(session_id)
+            if old is not None and old != key:
+                self._unref(old, session_id)
+            self._enforce_session(session_id, key)
+            self._enforce_global(key)
+            # 이미 같은 키가 있으면 저장소의 객체를 돌려줌 (같은 이미지를 세션마다 따로 갖지 않게)
+            return entry.image if entry.image is not None else image
+
+    def _get(self, session_id, name):
+        with self._lock:
+            self._release_closed()
+            key = self._sessions[session_id].get(name)
+            if key is None:
+                return None
+            entry = self._entries[key]
+            self._entries.move_to_end(key)
+            if entry.image is not None:
+                return entry.image
+            image = entry.unpack()
+            self._enforce_session(session_id, key)
+            self._enforce_global(key)
+            return image
+
+    def _find(self, key):
+        # 세션과 관계없이 key 로 저장된 이미지 (없으면 None), 찾은 이미지를 세션에 붙이려면 _set 을 다시 불러야 함
+        with self._lock:
+            self._release_closed()
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            if entry.image is not None:
+                return entry.image
+            image = entry.unpack()
+            self._enforce_global(key)
+            return image
+
+    def _discard(self, session_id, name):
+        with self._lock:
+            self._release_closed()
+            key = self._sessions[session_id].pop(name, None)
+            if key is not None:
+                self._unref(key, session_id)
+                self._enforce_global()
+
+    def stats(self):
+        with self._lock:
+            self._release_closed()
+            live = [entry for entry in self._entries.values() if entry.image is not None]
+            return {
+                "entries": len(self._entries),
+                "sessions": len(self._sessions),
+                "live_bytes": sum(entry.nbytes for entry in live),
+                "packed_bytes": sum(entry.size for entry in self._entries.values() if entry.image is None),
+            }
+
+
+class SessionImages:
+    # 세션 하나가 가진 이미지 이름 -> 저장소 키 (이미지는 저장소에만 있음)
+    def __init__(self, store, session_id):
+        self._store = store
+        self._id = session_id
+        weakref.finalize(self, store._closed.append, session_id)
+
+    def set(self, name, image, key=None):
+        # key: 내용을 대표하는 문자열 (예: 업로드 해시 + 크기), 없으면 픽셀 내용으로 해시
+        return self._store._set(self._id, name, image, key or image_digest(image))
+
+    def get(self, name):
+        return self._store._get(self._id, name)
+
+    def find(self, key):
+        # 다른 세션이 같은 키로 넣어 둔 이미지 (디코딩/리사이즈를 다시 하지 않기 위해 씀)
+        return self._store._find(key)
+
+    def key(self, name):
+        with self._store._lock:
+            return self._store._sessions[self._id].get(name)
+
+    def discard(self, name):
+        self._store._discard(self._id, name)
+
+    def __contains__(self, name):
+        return self.key(name) is not None
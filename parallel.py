@@ -0,0 +1,112 @@
+import collections
+import concurrent.futures
+import os
+from multiprocessing import shared_memory
+
+import numpy as np
+import cv2
+
+from animation import SpinRenderer, prepare_spin_source, spin_angles, _to_rgba_array
+
+
+# 워커 프로세스별 상태 (initializer 에서 한 번만 설정)
+_worker = {}
+
+
+def _create_shared(shape, dtype=np.uint8):
+    nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+    shm = shared_memory.SharedMemory(create=True, size=max(nbytes, 1))
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def _attach_shared(name, shape, dtype=np.uint8):
+    # 워커는 부모와 같은 resource_tracker 를 쓰므로 해제(unlink)는 만든 쪽(부모)에서만 함
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def _init_worker(source_spec, patch_spec, frames_spec, disc, blur_angle):
+    # 원본/패치/출력 버퍼를 이름으로 붙이기만 하고 이미지는 pickle 로 넘기지 않음
+    cv2.setNumThreads(1)
+    source_shm, source = _attach_shared(*source_spec)
+    frames_shm, frames = _attach_shared(*frames_spec)
+    handles = [source_shm, frames_shm]
+    patch = None
+    if patch_spec is not None:
+        patch_shm, patch = _attach_shared(*patch_spec)
+        handles.append(patch_shm)
+    _worker["handles"] = handles
+    _worker["frames"] = frames
+    _worker["renderer"] = SpinRenderer(source, disc=disc, patch=patch, blur_angle=blur_angle)
+
+
+def _render_chunk(slot, angles):
+    # 출력 버퍼의 slot 번째 칸에 angles 를 차례로 그림
+    renderer = _worker["renderer"]
+    out = _worker["frames"][slot]
+    for i, angle in enumerate(angles):
+        renderer.render(angle, out[i])
+    return slot, len(angles)
+
+
+def iter_spin_frames_parallel(image, frames=36, size=None, disc=None, patch=None, start_angle=0.0,
+                              clockwise=False, workers=None, chunk_size=2, max_in_flight=None, blur_angle=0.0):
+    # iter_spin_frames 와 같은 프레임을 프로세스 풀에서 병렬로 그려 순서대로 돌려줌
+    # 원본/패치는 shared_memory 에 한 번만 올리고, 워커는 겹치지 않는 각도 구간을 공유 출력 버퍼에 직접 그림
+    # 출력 버퍼는 max_in_flight 개의 구간만큼만 잡아 두고 돌려 쓰므로 프레임 수와 관계없이 메모리가 일정함
+    # (돌려받은 프레임은 공유 버퍼를 그대로 가리키므로 보관하려면 복사해야 함)
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or workers * 2
+    source, disc = prepare_spin_source(image, size=size, disc=disc)
+    angles = spin_angles(frames, start_angle=start_angle, clockwise=clockwise)
+    chunks = [angles[i:i + chunk_size] for i in range(0, len(angles), chunk_size)]
+    slots = min(max_in_flight, len(chunks))
+
+    handles = []
+    executor = None
+    shared_source = shared_patch = shared_frames = None
+    try:
+        source_shm, shared_source = _create_shared(source.shape)
+        handles.append(source_shm)
+        np.copyto(shared_source, source)
+        patch_spec = None
+        if patch is not None:
+            patch_array = _to_rgba_array(patch)
+            patch_shm, shared_patch = _create_shared(patch_array.shape)
+            handles.append(patch_shm)
+            np.copyto(shared_patch, patch_array)
+            patch_spec = (patch_shm.name, patch_array.shape)
+        frames_shape = (slots, chunk_size) + source.shape
+        frames_shm, shared_frames = _create_shared(frames_shape)
+        handles.append(frames_shm)
+        # disc 모드는 ROI 만 다시 그리므로 출력 칸마다 정적 배경을 한 번만 채워 둠
+        if disc is not None:
+            shared_frames[...] = source
+
+        executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker,
+            initargs=((source_shm.name, source.shape), patch_spec, (frames_shm.name, frames_shape), disc, blur_angle))
+        pending = collections.deque()
+        next_chunk = 0
+        while next_chunk < len(chunks) and len(pending) < slots:
+            pending.append(executor.submit(_render_chunk, next_chunk % slots, chunks[next_chunk]))
+            next_chunk += 1
+        while pending:
+            slot, count = pending.popleft().result()
+            for i in range(count):
+                yield shared_frames[slot, i]
+            # 이 칸의 프레임을 모두 넘겼으므로 다음 구간을 같은 칸에 맡김
+            if next_chunk < len(chunks):
+                pending.append(executor.submit(_render_chunk, next_chunk % slots, chunks[next_chunk]))
+                next_chunk += 1
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+        shared_source = shared_patch = shared_frames = None
+        for shm in handles:
+            try:
+                shm.close()
+            except BufferError:
+                # 호출한 쪽이 아직 프레임 배열을 들고 있으면 매핑은 그 배열이 사라질 때 해제됨
+                pass
+            shm.unlink()
@@ -0,0 +1,135 @@
+import numpy as np
+from PIL import Image
+
+from core import (composite_patch, cut_hole, key_background, merge_arrays, rotate_cd_array,
+                  rotate_image_array, _hole_mask)
+
+
+# 디코딩부터 저장까지 RGBA 배열 하나로 이어서 처리하는 파이프라인
+# PIL 은 처음 읽을 때(open)와 마지막에 저장할 때(save / image)만 사용하고,
+# 그 사이의 리사이즈 / 구멍 / 배경 제거 / 회전 / 합성은 H x W x 4 uint8 버퍼를 직접 수정함
+# 예) ImagePipeline.open("cd.png").resize((1000, 1000)).composite(patch, (500, 500), 60).rotate(30, disc="auto").save("out.png")
+
+
+def load_rgba(path):
+    # 파일을 RGBA 배열(C-contiguous uint8)로 한 번만 디코딩
+    image = Image.open(path)
+    if image.mode != "RGBA":
+        image = image.convert("RGBA")
+    return np.array(image)
+
+
+def load_rgba_image(image):
+    if image.mode != "RGBA":
+        image = image.convert("RGBA")
+    return np.array(image)
+
+
+def _as_rgba(source):
+    if isinstance(source, ImagePipeline):
+        return source.array
+    if isinstance(source, Image.Image):
+        return load_rgba_image(source)
+    if isinstance(source, str):
+        return load_rgba(source)
+    return np.ascontiguousarray(source, dtype=np.uint8)
+
+
+class ImagePipeline:
+    # array: 작업 버퍼 (H x W x 4 RGBA uint8), 각 단계는 이 버퍼를 제자리에서 바꾸고 self 를 돌려줌
+    # 제자리 처리가 안 되는 단계(전체 회전, 리사이즈)는 예비 버퍼에 그린 뒤 두 버퍼를 맞바꿈
+    def __init__(self, array):
+        array = np.ascontiguousarray(array, dtype=np.uint8)
+        if array.ndim != 3 or array.shape[2] != 4:
+            raise ValueError("파이프라인 버퍼는 H x W x 4 (RGBA) 배열이어야 합니다.")
+        if not array.flags.writeable:
+            array = array.copy()
+        self.array = array
+        self._spare = None
+
+    @classmethod
+    def open(cls, path):
+        return cls(load_rgba(path))
+
+    @classmethod
+    def from_image(cls, image):
+        return cls(load_rgba_image(image))
+
+    @property
+    def size(self):
+        return self.array.shape[1], self.array.shape[0]
+
+    def _spare_buffer(self, shape):
+        # 같은 크기의 예비 버퍼는 한 번만 할당해 다음 단계에서 다시 씀
+        if self._spare is None or self._spare.shape != shape:
+            self._spare = np.empty(shape, dtype=np.uint8)
+        return self._spare
+
+    def _swap(self, result):
+        self._spare, self.array = self.array, result
+        return self
+
+    def resize(self, size, interpolation=None):
+        import cv2
+
+        width, height = size
+        if (width, height) == self.size:
+            return self
+        if interpolation is None:
+            # 줄일 때는 INTER_AREA, 키울 때는 INTER_LINEAR
+            shrink = width * height < self.array.shape[0] * self.array.shape[1]
+            interpolation = cv2.INTER_AREA if shrink else cv2.INTER_LINEAR
+        out = self._spare_buffer((height, width, 4))
+        cv2.resize(self.array, (width, height), dst=out, interpolation=interpolation)
+        return self._swap(out)
+
+    def hole(self, radius, antialias=False):
+        cut_hole(self.array, radius, antialias=antialias)
+        return self
+
+    def key(self, **options):
+        # remove_background 와 같은 옵션 (threshold, tolerance, mode, key_color, key_range)
+        key_background(self.array, **options)
+        return self
+
+    def rotate(self, angle, disc=None, patch=None):
+        # disc="auto" 면 알파 채널에서 CD 영역을 찾아 그 원만 제자리에서 회전
+        # disc 가 없으면 rotate_image 와 같이 전체를 회전 (예비 버퍼에 그린 뒤 교체)
+        if isinstance(disc, str) and disc == "auto":
+            from rotation import detect_disc
+            disc = detect_disc(self.array[..., 3])
+            if disc is None:
+                raise ValueError("이미지에서 CD 영역(알파 > 0)을 찾을 수 없습니다.")
+        patch_array = None if patch is None else _as_rgba(patch)
+        if disc is not None:
+            rotate_cd_array(self.array, angle, patch_array=patch_array, disc=disc, out=self.array)
+            return self
+        out = self._spare_buffer(self.array.shape)
+        if patch_array is None:
+            rotate_image_array(self.array, angle, out=out)
+        else:
+            rotate_cd_array(self.array, angle, patch_array=patch_array, out=out)
+        return self._swap(out)
+
+    def composite(self, patch, position, radius, antialias=False, disc=None):
+        # apply_patch 와 같은 합성을 작업 버퍼에 바로 씀 (패치는 배경과 같은 크기)
+        patch_array = _as_rgba(patch)
+        if patch_array.shape != self.array.shape:
+            raise ValueError("배경 이미지와 패치 이미지는 같은 크기여야 합니다.")
+        hole_mask = _hole_mask(self.size, radius, antialias)
+        composite_patch(self.array, patch_array, position, hole_mask, out=self.array, disc=disc)
+        return self
+
+    def merge(self, patch, position, radius, is_transparent=True, key_mode="hard", antialias=False):
+        # merge_images 와 같은 합성을 작업 버퍼에 바로 씀 (넘겨받은 패치 배열은 복사해서 사용)
+        merge_arrays(self.array, _as_rgba(patch), position, radius, is_transparent=is_transparent,
+                     key_mode=key_mode, antialias=antialias, out=self.array)
+        return self
+
+    def image(self):
+        # PIL 이미지로 변환 (작업 버퍼를 복사하므로 이후 단계의 영향을 받지 않음)
+        return Image.fromarray(self.array.copy(), "RGBA")
+
+    def save(self, path, **options):
+        Image.fromarray(self.array, "RGBA").save(path, **options)
+        return path
@@ -0,0 +1,127 @@
+import collections
+import concurrent.futures
+import os
+import re
+import threading
+import uuid
+
+
+# 같은 입력(업로드 내용 해시 + 파라미터)의 렌더링 결과를 재사용하기 위한 캐시
+# ResultCache: 디스크에 <키>.<형식> 파일로 저장, 전체 크기가 max_bytes 를 넘으면 가장 오래 안 쓴 것부터 지움
+# Coalescer: 같은 키의 요청이 렌더링 중이면 새로 렌더링하지 않고 그 결과를 기다림
+
+# 캐시 파일 이름: <sha256 키>.<형식>, 렌더링 중인 임시 파일: .<키>.<uuid>.part.<형식>
+ENTRY_NAME = re.compile(r"^[0-9a-f]{64}\.(png|gif|apng|webp|mp4)$")
+PARTIAL_NAME = re.compile(r"^\.[0-9a-f]{64}\.[0-9a-f]{32}\.part\.(png|gif|apng|webp|mp4)$")
+
+
+class ResultCache:
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()  # 키 -> (파일 이름, 크기), 오래 안 쓴 순서
+        self.total_bytes = 0
+        os.makedirs(directory, exist_ok=True)
+        # 재시작해도 이전 결과를 쓰도록 마지막 사용 시각(mtime) 순서로 다시 읽음
+        # 캐시가 만든 이름(<키>.<형식>, 임시 파일)의 일반 파일만 다루고 그 밖의 파일/폴더는 건드리지 않음
+        found = []
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if not (ENTRY_NAME.match(name) or PARTIAL_NAME.match(name)) or not os.path.isfile(path) \
+                    or os.path.islink(path):
+                continue
+            if PARTIAL_NAME.match(name):
+                # 렌더링 도중 종료돼 남은 임시 파일
+                os.remove(path)
+                continue
+            stat = os.stat(path)
+            found.append((stat.st_mtime_ns, name, stat.st_size))
+        for _, name, size in sorted(found):
+            self._entries[name.partition(".")[0]] = (name, size)
+            self.total_bytes += size
+        with self._lock:
+            self._evict()
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and self._entries:
+            _, (name, size) = self._entries.popitem(last=False)
+            self.total_bytes -= size
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+
+    def open(self, key):
+        # 캐시에 있으면 (열린 파일, 형식), 없으면 None
+        # 파일을 연 뒤에는 다른 요청이 지워도 끝까지 읽을 수 있음
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            path = os.path.join(self.directory, entry[0])
+            try:
+                os.utime(path)
+                return open(path, "rb"), entry[0].partition(".")[2]
+            except FileNotFoundError:
+                self.total_bytes -= entry[1]
+                del self._entries[key]
+                return None
+
+    def partial_path(self, key, fmt):
+        # 렌더링 결과를 쓸 임시 경로 (commit 에서 같은 폴더 안에서 이름만 바꿈)
+        # 형식 확장자를 붙여 둠 (cv2.VideoWriter 는 확장자로 컨테이너를 정함)
+        return os.path.join(self.directory, f".{key}.{uuid.uuid4().hex}.part.{fmt}")
+
+    def commit(self, key, partial, fmt):
+        # 임시 파일을 캐시에 넣고 (열린 파일, 형식) 을 돌려줌
+        # max_bytes 보다 큰 결과는 돌려준 뒤 바로 지워지므로 캐시에 남지 않음
+        name = f"{key}.{fmt}"
+        path = os.path.join(self.directory, name)
+        size = os.path.getsize(partial)
+        with self._lock:
+            os.replace(partial, path)
+            fp = open(path, "rb")
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.total_bytes -= old[1]
+                if old[0] != name:
+                    os.remove(os.path.join(self.directory, old[0]))
+            self._entries[key] = (name, size)
+            self.total_bytes += size
+            self._evict()
+        return fp, fmt
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self.total_bytes, "max_bytes": self.max_bytes}
+
+
+class Coalescer:
+    # 키별로 처음 온 요청(leader)만 렌더링하고 같은 키의 나머지 요청은 leader 의 Future 를 기다림
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    def join(self, key):
+        # (Future, leader 여부), leader 는 끝나면 반드시 finish 를 불러야 함
+        with self._lock:
+            future = self._pending.get(key)
+            if future is not None:
+                return future, False
+            future = concurrent.futures.Future()
+            self._pending[key] = future
+            return future, True
+
+    def finish(self, key, result=None, error=None):
+        with self._lock:
+            future = self._pending.pop(key)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._pending)
@@ -0,0 +1,232 @@
+import functools
+
+import numpy as np
+import cv2
+
+
+@functools.lru_cache(maxsize=16)
+def _coordinate_grid(width, height):
+    # 이미지 크기별 x, y 좌표 벡터 (극좌표 좌표표를 만들 때 재사용)
+    xs = np.arange(width, dtype=np.float32)
+    ys = np.arange(height, dtype=np.float32)
+    xs.flags.writeable = False
+    ys.flags.writeable = False
+    return xs, ys
+
+
+class RotationEngine:
+    # 같은 원본을 여러 각도로 회전하는 호출을 묶어 주는 cv2.warpAffine 래퍼 (보간 방식을 한 곳에서 정함)
+    # 각도마다 좌표표가 달라 미리 만들어 두어도 warpAffine 보다 빠르지 않으므로 좌표표는 캐시하지 않음
+    def __init__(self, interpolation=cv2.INTER_LINEAR):
+        self.interpolation = interpolation
+
+    def rotate(self, array, angle, center=None, out=None):
+        height, width = array.shape[:2]
+        if center is None:
+            center = (width / 2, height / 2)
+        matrix = cv2.getRotationMatrix2D((float(center[0]), float(center[1])), float(angle), 1.0)
+        return cv2.warpAffine(array, matrix, (width, height), dst=out, flags=self.interpolation,
+                              borderMode=cv2.BORDER_CONSTANT, borderValue=0)
+
+    def iter_rotate(self, array, angles, center=None):
+        # 같은 원본을 여러 각도로 회전 (한 프레임씩 생성)
+        for angle in angles:
+            yield self.rotate(array, angle, center=center)
+
+    def rotate_batch(self, array, angles, center=None, out=None):
+        # 여러 각도를 한 번에 그려 (N, H, W, C) 배열로 반환
+        angles = list(angles)
+        if out is None:
+            out = np.empty((len(angles),) + array.shape, dtype=array.dtype)
+        for i, angle in enumerate(angles):
+            self.rotate(array, angle, center=center, out=out[i])
+        return out
+
+
+default_engine = RotationEngine()
+
+
+def rotate_array(array, angle, center=None, out=None):
+    return default_engine.rotate(array, angle, center=center, out=out)
+
+
+def rotate_batch(array, angles, center=None, out=None):
+    return default_engine.rotate_batch(array, angles, center=center, out=out)
+
+
+def detect_disc(alpha, threshold=0):
+    # 알파 채널에서 색상이 있는 영역(alpha > threshold)의 외접 사각형으로 CD 원(중심, 반지름)을 추정
+    # 중심은 픽셀 인덱스 좌표 (cv2 회전 중심과 같은 기준)
+    visible = alpha > threshold
+    rows = np.flatnonzero(visible.any(axis=1))
+    cols = np.flatnonzero(visible.any(axis=0))
+    if rows.size == 0:
+        return None
+    x0, x1 = int(cols[0]), int(cols[-1])
+    y0, y1 = int(rows[0]), int(rows[-1])
+    return ((x0 + x1) / 2, (y0 + y1) / 2, (max(x1 - x0, y1 - y0) + 1) / 2)
+
+
+def disc_bbox(disc, size):
+    # 원을 감싸는 사각형 (x0, y0, x1, y1), 보간을 위해 1픽셀 여유를 두고 이미지 경계로 자름
+    cx, cy, r = disc
+    width, height = size
+    x0 = max(0, int(np.floor(cx - r)) - 1)
+    y0 = max(0, int(np.floor(cy - r)) - 1)
+    x1 = min(width, int(np.ceil(cx + r)) + 1)
+    y1 = min(height, int(np.ceil(cy + r)) + 1)
+    return x0, y0, x1, y1
+
+
+def _alpha_over(dst, src, inside):
+    # src 를 dst 위에 알파 합성 (원 안쪽 픽셀만, straight alpha 기준)
+    src_alpha = src[..., 3]
+    # 완전히 불투명한 픽셀은 RGBA 4바이트를 그대로 복사
+    opaque = src_alpha == 255
+    opaque &= inside
+    np.copyto(dst.view(np.uint32)[..., 0], src.view(np.uint32)[..., 0], where=opaque)
+
+    # 반투명 픽셀(알파 1~254)만 실수 연산으로 합성
+    # 경계 부근의 소수 픽셀이므로 불리언 인덱싱 대신 평탄화한 위치로 직접 골라 냄
+    partial = (src_alpha - np.uint8(1)) < 254
+    partial &= inside
+    index = np.flatnonzero(partial)
+    if index.size == 0:
+        return
+    ys, xs = np.divmod(index, partial.shape[1])
+    s = src[ys, xs].astype(np.float32)
+    d = dst[ys, xs].astype(np.float32)
+    s_a = s[:, 3:] / 255
+    d_a = d[:, 3:] / 255 * (1 - s_a)
+    out_a = s_a + d_a
+    d[:, :3] = (s[:, :3] * s_a + d[:, :3] * d_a) / np.maximum(out_a, 1e-6)
+    d[:, 3:] = out_a * 255
+    dst[ys, xs] = np.clip(np.rint(d), 0, 255).astype(np.uint8)
+
+
+class DiscSpinner:
+    # 원형 CD 영역(disc)만 회전/합성하고, 나머지 정적 배경은 그대로 재사용
+    # image_array: H x W x 4 (RGBA) 캔버스, disc: (cx, cy, r), 없으면 알파 채널에서 찾음
+    # background: 원 아래에 깔릴 정적 배경 (없으면 캔버스의 원 바깥 부분만 배경으로 사용)
+    # blur_angle: 원 둘레 방향 모션 블러 각도(도), 회전과 순서를 바꿔도 결과가 같으므로 원본에 한 번만 적용
+    def __init__(self, image_array, disc=None, background=None, engine=None, blur_angle=0.0):
+        height, width = image_array.shape[:2]
+        if disc is None:
+            disc = detect_disc(image_array[..., 3])
+            if disc is None:
+                raise ValueError("이미지에서 CD 영역(알파 > 0)을 찾을 수 없습니다.")
+        self.disc = disc
+        self.engine = engine or default_engine
+        x0, y0, x1, y1 = disc_bbox(disc, (width, height))
+        self.bbox = (x0, y0, x1, y1)
+        self.roi = (slice(y0, y1), slice(x0, x1))
+
+        # 회전에 쓰이는 ROI 원본과 ROI 기준 회전 중심
+        cx, cy, r = disc
+        self._source = np.ascontiguousarray(image_array[self.roi])
+        self._center = (cx - x0, cy - y0)
+        if blur_angle > 0:
+            self._source = angular_blur(self._source, blur_angle, center=self._center, radius=r + 1)
+
+        # ROI 안의 원 마스크
+        ys = np.arange(y0, y1, dtype=np.float32)[:, None] - cy
+        xs = np.arange(x0, x1, dtype=np.float32)[None, :] - cx
+        self._inside = xs * xs + ys * ys <= r * r
+
+        # ROI 밖 정적 배경은 복사하지 않고 참조만 하고, ROI 의 정적 배경만 따로 보관
+        self._canvas = image_array if background is None else background
+        self._static_roi = self._canvas[self.roi].copy()
+        if background is None:
+            self._static_roi[self._inside] = 0
+        self._rotated = np.empty_like(self._source)
+        self._frame = None
+
+    def render_roi(self, angle, out=None):
+        # ROI 크기의 회전 + 합성 결과만 계산
+        rotated = self.engine.rotate(self._source, angle, center=self._center, out=self._rotated)
+        if out is None:
+            out = self._static_roi.copy()
+        else:
+            np.copyto(out, self._static_roi)
+        _alpha_over(out, rotated, self._inside)
+        return out
+
+    def render(self, angle, out=None):
+        # 전체 프레임에 ROI 만 다시 써 넣음
+        # out 을 넘기는 경우 ROI 밖은 이미 정적 배경이 들어 있어야 함
+        # (out 이 없으면 내부 프레임 버퍼를 재사용하므로 결과를 보관하려면 복사해야 함)
+        if out is None:
+            if self._frame is None:
+                self._frame = self._canvas.copy()
+            out = self._frame
+        self.render_roi(angle, out=out[self.roi])
+        return out
+
+
+def spin_blur_angle(rpm, shutter):
+    # 셔터가 열려 있는 동안(shutter 초) rpm 으로 도는 원판이 지나가는 각도(도)
+    return 360.0 * rpm / 60.0 * shutter
+
+
+@functools.lru_cache(maxsize=8)
+def _polar_maps(width, height, cx, cy, radius):
+    # 극좌표 변환용 remap 좌표표 (원본 -> 극좌표, 극좌표 -> 원본)
+    # 극좌표 이미지는 행이 각도, 열이 반지름이며 가장 바깥 원에서 각도 한 칸이 한 픽셀 정도가 되도록 함
+    angle_samples = max(360, int(np.ceil(2 * np.pi * radius)))
+    radius_samples = max(1, int(np.ceil(radius)))
+    rho = np.arange(radius_samples, dtype=np.float32) * (radius / radius_samples)
+    phi = np.arange(angle_samples, dtype=np.float32) * (2 * np.pi / angle_samples)
+    to_polar_x = (cx + np.cos(phi)[:, None] * rho[None, :]).astype(np.float32)
+    to_polar_y = (cy + np.sin(phi)[:, None] * rho[None, :]).astype(np.float32)
+
+    xs, ys = _coordinate_grid(width, height)
+    dx = xs[None, :] - np.float32(cx)
+    dy = ys[:, None] - np.float32(cy)
+    from_polar_x = np.hypot(dx, dy) * (radius_samples / radius)
+    from_polar_y = np.mod(np.arctan2(dy, dx), 2 * np.pi) * (angle_samples / (2 * np.pi))
+    maps = (to_polar_x, to_polar_y, from_polar_x.astype(np.float32), from_polar_y.astype(np.float32))
+    for m in maps:
+        m.flags.writeable = False
+    return maps
+
+
+def angular_blur(array, blur_angle, center=None, radius=None):
+    # center 를 중심으로 원 둘레 방향으로 blur_angle(도) 만큼 흐리게 함 (회전하는 CD 의 모션 블러)
+    # 여러 각도로 회전한 결과를 평균내지 않고, 극좌표로 펴서 각도 방향 1차원 블러 후 되돌림
+    # 블러 각도와 관계없이 비용은 remap 두 번과 박스 블러 한 번 정도
+    height, width = array.shape[:2]
+    if center is None:
+        center = (width / 2, height / 2)
+    if radius is None:
+        corners = np.array([(0, 0), (width, 0), (0, height), (width, height)], dtype=np.float64)
+        radius = float(np.hypot(*(corners - center).T).max())
+    if blur_angle <= 0:
+        return array.copy()
+
+    to_x, to_y, from_x, from_y = _polar_maps(width, height, float(center[0]), float(center[1]), float(radius))
+    angle_samples = to_x.shape[0]
+    kernel = min(angle_samples, max(1, int(round(blur_angle / 360.0 * angle_samples))))
+
+    # 알파가 있으면 프리멀티플라이드로 흐려야 투명한 부분의 색이 번지지 않음
+    data = array.astype(np.float32)
+    has_alpha = data.ndim == 3 and data.shape[2] == 4
+    if has_alpha:
+        data[..., :3] *= data[..., 3:] / 255
+
+    polar = cv2.remap(data, to_x, to_y, cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT, borderValue=0)
+    if kernel > 1:
+        # 각도 축(행)은 한 바퀴가 이어지므로 위아래를 서로 이어 붙인 뒤 흐림
+        pad = kernel // 2 + 1
+        padded = np.concatenate([polar[-pad:], polar, polar[:pad]])
+        polar = cv2.blur(padded, (1, kernel))[pad:pad + angle_samples]
+    # 되돌릴 때도 각도 축은 0 과 360 도가 이어지도록 감싸서 보간
+    blurred = cv2.remap(polar, from_x, from_y, cv2.INTER_LINEAR, borderMode=cv2.BORDER_WRAP)
+
+    if has_alpha:
+        alpha = blurred[..., 3:]
+        blurred[..., :3] *= 255 / np.maximum(alpha, 1e-3)
+    out = np.clip(np.rint(blurred), 0, 255).astype(array.dtype)
+
+    # 반지름 밖은 원본 그대로
+    out[from_x >= to_x.shape[1] - 1] = array[from_x >= to_x.shape[1] - 1]
+    return out
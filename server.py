@@ -0,0 +1,472 @@
+import concurrent.futures
+import email.message
+import hashlib
+import http.server
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import urllib.parse
+
+from PIL import Image
+
+from result_cache import Coalescer, ResultCache
+
+
+# 다른 시스템에서 합성/회전/애니메이션 저장을 호출하기 위한 HTTP 서비스 (표준 라이브러리만 사용)
+# 요청: POST /compose, /merge, /rotate, /export (multipart/form-data, 파라미터는 쿼리 문자열 또는 폼 필드)
+#   compose, merge: background, patch 파일 + x, y, radius, antialias, disc / opaque, key_mode
+#   rotate: image (+ patch) 파일 + angle, disc
+#   export: image (+ patch) 파일 + frames, fps, width, height, format, disc, clockwise, rpm
+#           (frames, width/height, rpm 은 MAX_FRAMES, MAX_SIDE, MAX_RPM 이하)
+# 업로드는 청크 단위로 요청별 임시 폴더에 바로 쓰고, 렌더링은 프로세스 풀에서 함
+# 풀이 가득 차면 업로드를 읽기 전에 429 (Retry-After) 로 거절함
+# 요청은 업로드 내용 해시 + 작업 + 파라미터로 키를 만들어, 같은 요청이 렌더링 중이면 그 결과를 함께 쓰고
+# 끝난 결과는 디스크 캐시(result_cache.py)에 두어 다시 렌더링하지 않음 (응답 헤더 X-Cache: hit / miss / coalesced)
+# 예) python cli.py serve --port 8000 --workers 4
+#     curl -F background=@cd.png -F patch=@patch.png "localhost:8000/compose?x=500&y=500&radius=60" -o out.png
+
+MAX_UPLOAD_BYTES = int(os.environ.get("CD_ROTATOR_MAX_UPLOAD", 64 << 20))
+# export 파라미터 한도 (요청 하나가 워커를 오래 붙잡거나 메모리를 크게 쓰지 않도록, 넘으면 400)
+MAX_FRAMES = int(os.environ.get("CD_ROTATOR_MAX_FRAMES", 720))
+MAX_SIDE = int(os.environ.get("CD_ROTATOR_MAX_SIDE", 4096))
+MAX_RPM = float(os.environ.get("CD_ROTATOR_MAX_RPM", 10000))
+CHUNK_BYTES = 64 << 10
+MAX_FIELD_BYTES = 64 << 10
+CACHE_DIR = os.environ.get("CD_ROTATOR_CACHE_DIR", ".result_cache")
+CACHE_BYTES = int(os.environ.get("CD_ROTATOR_CACHE_BYTES", 1 << 30))
+# 렌더링 결과가 바뀌는 수정을 하면 올려서 이전 캐시를 쓰지 않게 함
+RENDER_VERSION = 1
+
+OPERATIONS = ("compose", "merge", "rotate", "export")
+
+# 결과 형식별 Content-Type
+CONTENT_TYPES = {
+    "png": "image/png",
+    "gif": "image/gif",
+    "apng": "image/apng",
+    "webp": "image/webp",
+    "mp4": "video/mp4",
+}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _int(params, name, default=None):
+    value = params.get(name)
+    if value in (None, ""):
+        if default is None:
+            raise ValueError(f"{name} 값이 필요합니다.")
+        return default
+    return int(value)
+
+
+def _float(params, name, default=None):
+    value = params.get(name)
+    if value in (None, ""):
+        if default is None:
+            raise ValueError(f"{name} 값이 필요합니다.")
+        return default
+    return float(value)
+
+
+def _flag(params, name):
+    return str(params.get(name, "")).lower() in ("1", "true", "yes", "on")
+
+
+def _open_rgba(files, name, required=True):
+    path = files.get(name)
+    if path is None:
+        if required:
+            raise ValueError(f"{name} 이미지 파일이 필요합니다.")
+        return None
+    image = Image.open(path)
+    if image.mode != "RGBA":
+        image = image.convert("RGBA")
+    return image
+
+
+def _find_disc(image):
+    import numpy as np
+    from rotation import detect_disc
+
+    disc = detect_disc(np.asarray(image)[..., 3])
+    if disc is None:
+        raise ValueError("이미지에서 CD 영역(알파 > 0)을 찾을 수 없습니다.")
+    return disc
+
+
+def output_format(operation, params):
+    # 결과 형식 (렌더링 전에 임시 파일 확장자를 정하는 데 씀, mp4 는 확장자가 있어야 cv2 가 파일을 엶)
+    if operation != "export":
+        return "png"
+    fmt = params.get("format") or "gif"
+    if fmt not in CONTENT_TYPES or fmt == "png":
+        raise ValueError(f"지원하지 않는 애니메이션 형식입니다: {fmt} (gif, apng, webp, mp4)")
+    return fmt
+
+
+def _export_options(params):
+    frames = _int(params, "frames", 36)
+    fps = _float(params, "fps", 24.0)
+    width, height = _int(params, "width", 0), _int(params, "height", 0)
+    rpm = _float(params, "rpm", 0.0)
+    if not 1 <= frames <= MAX_FRAMES:
+        raise ValueError(f"frames 는 1 이상 {MAX_FRAMES} 이하여야 합니다.")
+    if not fps > 0:
+        raise ValueError("fps 는 0 보다 커야 합니다.")
+    if width < 0 or height < 0 or bool(width) != bool(height):
+        raise ValueError("width 와 height 는 둘 다 1 이상이거나 둘 다 비워야 합니다.")
+    if width > MAX_SIDE or height > MAX_SIDE:
+        raise ValueError(f"width 와 height 는 {MAX_SIDE} 이하여야 합니다.")
+    if not abs(rpm) <= MAX_RPM:
+        raise ValueError(f"rpm 은 -{MAX_RPM:g} 이상 {MAX_RPM:g} 이하여야 합니다.")
+    return {"frames": frames, "fps": fps, "size": (width, height) if width else None, "rpm": rpm or None}
+
+
+def render_request(operation, files, params, output):
+    # 요청 하나를 렌더링해 output 경로에 쓰고 결과 형식을 돌려줌 (프로세스 풀 워커에서 실행)
+    # files: 폼 필드 이름 -> 업로드 임시 파일 경로, params: 파라미터 이름 -> 문자열
+    from core import apply_patch, merge_images, rotate_cd, rotate_image
+
+    if operation in ("compose", "merge"):
+        background = _open_rgba(files, "background")
+        patch = _open_rgba(files, "patch")
+        # apply_patch 는 같은 크기를 요구하므로 패치를 배경 크기에 맞춤 (웹 UI 의 RESIZE 와 같음)
+        if patch.size != background.size:
+            patch = patch.resize(background.size)
+        position = (_int(params, "x", background.width // 2), _int(params, "y", background.height // 2))
+        radius = _int(params, "radius", 50)
+        if operation == "merge":
+            result = merge_images(background, patch, position, radius, is_transparent=not _flag(params, "opaque"),
+                                  key_mode=params.get("key_mode") or "hard", antialias=_flag(params, "antialias"))
+        else:
+            disc = _find_disc(background) if _flag(params, "disc") else None
+            result = apply_patch(background, patch, position, radius, debug=False, disc=disc,
+                                 antialias=_flag(params, "antialias"))
+        result.save(output, format="PNG")
+        return "png"
+
+    if operation == "rotate":
+        image = _open_rgba(files, "image")
+        patch = _open_rgba(files, "patch", required=False)
+        angle = _float(params, "angle")
+        if _flag(params, "disc") or patch is not None:
+            disc = _find_disc(image) if _flag(params, "disc") else None
+            result = rotate_cd(image, patch, angle, disc=disc)
+        else:
+            result = rotate_image(image, angle)
+        result.save(output, format="PNG")
+        return "png"
+
+    if operation == "export":
+        from animation import export_spin
+
+        fmt = output_format(operation, params)
+        options = _export_options(params)
+        image = _open_rgba(files, "image")
+        patch = _open_rgba(files, "patch", required=False)
+        export_spin(output, image, fmt=fmt, disc=_find_disc(image) if _flag(params, "disc") else None,
+                    patch=patch, clockwise=_flag(params, "clockwise"), **options)
+        return fmt
+
+    raise ValueError(f"지원하지 않는 작업입니다: {operation}")
+
+
+def _init_worker():
+    # 요청마다 프로세스 하나가 렌더링하므로 cv2 내부 스레드는 쓰지 않음
+    import cv2
+    cv2.setNumThreads(1)
+
+
+class RenderPool:
+    # 렌더링 프로세스 풀 + 동시에 받을 수 있는 요청 수 제한
+    # capacity = workers (렌더링 중) + queue_size (대기 중), 자리가 없으면 try_acquire 가 False
+    def __init__(self, workers=None, queue_size=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.capacity = self.workers + (self.workers if queue_size is None else queue_size)
+        self._slots = threading.BoundedSemaphore(self.capacity)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers,
+                                                                initializer=_init_worker)
+
+    def try_acquire(self):
+        if not self._slots.acquire(blocking=False):
+            return False
+        with self._lock:
+            self.in_flight += 1
+        return True
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def render(self, operation, files, params, output):
+        return self._executor.submit(render_request, operation, files, params, output).result()
+
+    def shutdown(self):
+        self._executor.shutdown()
+
+
+def request_key(operation, params, digests):
+    # 같은 작업 + 같은 파라미터 + 같은 내용의 업로드면 같은 키 (파일 이름/업로드 순서와 무관)
+    payload = json.dumps({"version": RENDER_VERSION, "operation": operation, "params": params,
+                          "files": digests}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _iter_body(rfile, length):
+    remaining = length
+    while remaining > 0:
+        chunk = rfile.read(min(CHUNK_BYTES, remaining))
+        if not chunk:
+            raise HTTPError(400, "요청 본문이 끝까지 전송되지 않았습니다.")
+        remaining -= len(chunk)
+        yield chunk
+
+
+def _part_headers(raw):
+    message = email.message.Message()
+    for line in raw.decode("utf-8", "replace").split("\r\n"):
+        key, sep, value = line.partition(":")
+        if sep:
+            message[key.strip()] = value.strip()
+    name = message.get_param("name", header="content-disposition")
+    if not name:
+        raise HTTPError(400, "multipart 파트에 name 이 없습니다.")
+    return name, message.get_filename()
+
+
+def read_multipart(rfile, length, boundary, directory):
+    # multipart/form-data 본문을 청크 단위로 읽으며 파일 파트는 directory 에 바로 씀
+    # 돌려주는 값: (fields: 이름 -> 문자열, files: 이름 -> 임시 파일 경로, digests: 이름 -> 파일 내용 sha256)
+    delimiter = b"\r\n--" + boundary
+    fields, files, hashes = {}, {}, {}
+    buffer = bytearray(b"\r\n")
+    state = "preamble"
+    sink = None
+    name = None
+    try:
+        for chunk in _iter_body(rfile, length):
+            buffer += chunk
+            while True:
+                if state in ("preamble", "data"):
+                    index = buffer.find(delimiter)
+                    # 구분자가 청크 경계에 걸칠 수 있으므로 구분자 길이만큼은 남겨 둠
+                    keep = len(buffer) - len(delimiter) + 1 if index < 0 else index
+                    if state == "data" and keep > 0:
+                        sink.write(buffer[:keep])
+                        if name in hashes:
+                            hashes[name].update(buffer[:keep])
+                        if sink.tell() > MAX_FIELD_BYTES and name not in files:
+                            raise HTTPError(400, f"폼 필드가 너무 깁니다: {name}")
+                    if index < 0:
+                        del buffer[:max(0, keep)]
+                        break
+                    del buffer[:index + len(delimiter)]
+                    if state == "data":
+                        if name in files:
+                            sink.close()
+                        else:
+                            fields[name] = sink.getvalue().decode("utf-8")
+                    state = "boundary"
+                if state == "boundary":
+                    if len(buffer) < 2:
+                        break
+                    if buffer[:2] == b"--":
+                        state = "end"
+                        break
+                    state = "headers"
+                if state == "headers":
+                    index = buffer.find(b"\r\n\r\n")
+                    if index < 0:
+                        if len(buffer) > MAX_FIELD_BYTES:
+                            raise HTTPError(400, "multipart 헤더가 너무 깁니다.")
+                        break
+                    name, filename = _part_headers(bytes(buffer[2:index]))
+                    del buffer[:index + 4]
+                    if filename is not None:
+                        files[name] = os.path.join(directory, f"upload-{len(files)}")
+                        sink = open(files[name], "wb")
+                        hashes[name] = hashlib.sha256()
+                    else:
+                        sink = io.BytesIO()
+                    state = "data"
+                if state == "end":
+                    break
+    finally:
+        if sink is not None and not sink.closed and name in files:
+            sink.close()
+    if state != "end":
+        raise HTTPError(400, "multipart 본문이 올바르게 끝나지 않았습니다.")
+    return fields, files, {name: hasher.hexdigest() for name, hasher in hashes.items()}
+
+
+class RenderHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    pool = None
+    cache = None
+    coalescer = None
+
+    def _send_json(self, status, payload, headers=()):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in headers:
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status, message, headers=()):
+        # 본문을 다 읽지 않은 채 응답하는 경우가 있으므로 연결은 닫음
+        self.close_connection = True
+        self._send_json(status, {"error": message}, headers=tuple(headers) + (("Connection", "close"),))
+
+    def _send_result(self, result, key, cache_status):
+        fp, fmt = result
+        with fp:
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPES[fmt])
+            self.send_header("Content-Length", str(os.fstat(fp.fileno()).st_size))
+            self.send_header("ETag", f'"{key}"')
+            self.send_header("X-Cache", cache_status)
+            self.end_headers()
+            shutil.copyfileobj(fp, self.wfile, CHUNK_BYTES)
+
+    def _render(self, key, operation, files, params):
+        # 캐시 폴더의 임시 파일에 렌더링한 뒤 캐시에 넣음
+        fmt = output_format(operation, params)
+        if operation == "export":
+            # 잘못된 파라미터는 워커에 보내기 전에 400 으로 거절
+            _export_options(params)
+        partial = self.cache.partial_path(key, fmt)
+        try:
+            fmt = self.pool.render(operation, files, params, partial)
+        except BaseException:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+        return self.cache.commit(key, partial, fmt)
+
+    def do_GET(self):
+        if urllib.parse.urlsplit(self.path).path != "/health":
+            return self._send_error(404, "없는 경로입니다.")
+        self._send_json(200, {"workers": self.pool.workers, "capacity": self.pool.capacity,
+                              "in_flight": self.pool.in_flight, "rendering_keys": len(self.coalescer),
+                              "cache": self.cache.stats()})
+
+    def do_POST(self):
+        url = urllib.parse.urlsplit(self.path)
+        operation = url.path.strip("/")
+        if operation not in OPERATIONS:
+            return self._send_error(404, "없는 경로입니다.")
+        # 업로드를 받기 전에 자리부터 확보 (가득 차면 본문을 읽지 않고 바로 거절)
+        if not self.pool.try_acquire():
+            return self._send_error(429, "요청이 많아 처리할 수 없습니다. 잠시 후 다시 시도하세요.",
+                                    headers=(("Retry-After", "1"),))
+        holding = True
+        try:
+            with tempfile.TemporaryDirectory(prefix="cd-rotator-") as directory:
+                fields, files, digests = self._read_upload(directory)
+                params = dict(urllib.parse.parse_qsl(url.query), **fields)
+                key = request_key(operation, params, digests)
+                cache_status = "hit"
+                result = self.cache.open(key)
+                if result is None:
+                    future, leader = self.coalescer.join(key)
+                    if leader:
+                        cache_status = "miss"
+                        try:
+                            result = self._render(key, operation, files, params)
+                        except BaseException as e:
+                            self.coalescer.finish(key, error=e)
+                            raise
+                        self.coalescer.finish(key)
+                    else:
+                        # 같은 요청이 렌더링 중이면 자리를 돌려주고 그 결과를 기다림
+                        self.pool.release()
+                        holding = False
+                        future.result()
+                        cache_status = "coalesced"
+                        result = self.cache.open(key)
+                        if result is None:
+                            # 캐시 한도보다 커서 남지 않은 결과는 직접 렌더링
+                            holding = self.pool.try_acquire()
+                            if not holding:
+                                raise HTTPError(429, "요청이 많아 처리할 수 없습니다. 잠시 후 다시 시도하세요.")
+                            result = self._render(key, operation, files, params)
+                # 결과를 보내는 동안에는 렌더링 자리를 차지하지 않음
+                if holding:
+                    self.pool.release()
+                    holding = False
+                self._send_result(result, key, cache_status)
+        except HTTPError as e:
+            self._send_error(e.status, str(e), headers=(("Retry-After", "1"),) if e.status == 429 else ())
+        except Image.DecompressionBombError as e:
+            # 업로드 크기는 작아도 픽셀 수가 Pillow 한도를 넘는 이미지
+            self._send_error(413, str(e))
+        except (ValueError, OSError) as e:
+            self._send_error(400, str(e))
+        except Exception as e:
+            self.log_error("렌더링 실패: %r", e)
+            self._send_error(500, "렌더링 중 오류가 발생했습니다.")
+        finally:
+            if holding:
+                self.pool.release()
+
+    def _read_upload(self, directory):
+        content_type = email.message.Message()
+        content_type["content-type"] = self.headers.get("Content-Type", "")
+        boundary = content_type.get_param("boundary")
+        if content_type.get_content_type() != "multipart/form-data" or not boundary:
+            raise HTTPError(415, "multipart/form-data 로 업로드하세요.")
+        length = self.headers.get("Content-Length")
+        if length is None:
+            raise HTTPError(411, "Content-Length 가 필요합니다.")
+        if int(length) > MAX_UPLOAD_BYTES:
+            raise HTTPError(413, f"업로드가 너무 큽니다. (최대 {MAX_UPLOAD_BYTES} 바이트)")
+        return read_multipart(self.rfile, int(length), boundary.encode("latin-1"), directory)
+
+    def log_message(self, format, *args):
+        sys.stderr.write(f"{self.address_string()} {format % args}\n")
+
+
+def serve(host="127.0.0.1", port=8000, workers=None, queue_size=None, cache_dir=None, cache_bytes=None):
+    pool = RenderPool(workers, queue_size)
+    cache = ResultCache(cache_dir or CACHE_DIR, CACHE_BYTES if cache_bytes is None else cache_bytes)
+    handler = type("BoundRenderHandler", (RenderHandler,), {"pool": pool, "cache": cache, "coalescer": Coalescer()})
+    server = http.server.ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    print(f"http://{host}:{server.server_address[1]} (workers {pool.workers}, 최대 요청 {pool.capacity})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        pool.shutdown()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="CD 이미지 합성/회전 HTTP 서비스")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--queue", type=int, help="렌더링을 기다릴 수 있는 요청 수 (기본: workers)")
+    parser.add_argument("--cache-dir", help=f"결과 캐시 폴더 (기본: {CACHE_DIR})")
+    parser.add_argument("--cache-mb", type=int, help="결과 캐시 최대 크기 (MB)")
+    args = parser.parse_args()
+    serve(args.host, args.port, args.workers, args.queue, cache_dir=args.cache_dir,
+          cache_bytes=None if args.cache_mb is None else args.cache_mb << 20)
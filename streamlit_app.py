@@ -1,72 +1,37 @@
 import streamlit as st
 st.set_page_config(layout="wide")
-from PIL import Image, ImageDraw
+from PIL import Image
 import os
-import numpy as np
-import math
-import cv2
+import hashlib
+import io
+import uuid
+import threading
+from core import rotate_cd, apply_patch, _rgba_array
+from rotation import DiscSpinner
+from image_store import ImageStore, image_digest
+from encoding import encode_image, encode_frame, encode_preview, file_extension, mime_type
 
-def remove_background(patch_image):
-    # Patch 이미지를 RGBA 형식으로 변환
-    patch_rgba = patch_image.convert("RGBA")
-    
-    # Patch 이미지의 픽셀 데이터를 가져옴
-    pixels = patch_rgba.load()
-    
-    # 이미지의 너비와 높이를 가져옴
-    width, height = patch_rgba.size
-    
-    # 모든 픽셀을 순회하며 배경 부분을 투명하게 처리
-    for x in range(width):
-        for y in range(height):
-            r, g, b, a = pixels[x, y]  # 픽셀의 RGBA 값 가져오기
-            
-            # 예시로 흰색 배경을 제거하는 것으로 가정
-            if r > 200 and g > 200 and b > 200:
-                pixels[x, y] = (r, g, b, 0)  # 배경 부분을 투명하게 처리
-    return patch_rgba
-
-def rotate_cd(cd_image, patch_image, angle):
-    # CD 이미지를 numpy 배열로 변환
-    cd_array = np.array(cd_image)
-    
-    # Patch 이미지를 numpy 배열로 변환
-    patch_array = np.array(patch_image)
-    
-    # 회전 중심점 계산
-    center = (cd_array.shape[1] // 2, cd_array.shape[0] // 2)
-    
-    # 회전 변환 행렬 계산
-    rotation_matrix = cv2.getRotationMatrix2D(center, angle, 1.0)
-    
-    # CD 이미지를 회전시킴
-    rotated_cd_array = cv2.warpAffine(cd_array, rotation_matrix, (cd_array.shape[1], cd_array.shape[0]))
-    
-    # Patch 이미지를 CD 이미지에 적용
-    rotated_cd_array[50:50+patch_array.shape[0], 50:50+patch_array.shape[1]] = patch_array
-    
-    # 회전된 배열을 이미지로 변환
-    rotated_cd_image = Image.fromarray(rotated_cd_array)
-    
-    return rotated_cd_image
+# 화면 표시용 인코딩 캐시 크기 기준 (업로드 이미지 수, 모든 세션이 공유, 오래 안 쓴 것부터 제거)
+# 디코딩/리사이즈한 이미지 자체는 아래 이미지 저장소에만 두어 저장소 한도에 포함됨
+IMAGE_CACHE_ENTRIES = int(os.environ.get("CD_ROTATOR_IMAGE_CACHE", "16"))
 
-def rotate_image(image, angle):
-    # 이미지를 numpy 배열로 변환
-    image_array = np.array(image)
-    
-    # 회전 중심점 계산
-    center = (image_array.shape[1] / 2, image_array.shape[0] / 2)
-    
-    # 회전 변환 행렬 계산
-    rotation_matrix = cv2.getRotationMatrix2D(center, angle, 1.0)
-    
-    # 이미지를 회전시킴
-    rotated_array = cv2.warpAffine(image_array, rotation_matrix, (image_array.shape[1], image_array.shape[0]))
-    
-    # 회전된 배열을 이미지로 변환
-    rotated_image = Image.fromarray(rotated_array)
-    
-    return rotated_image
+# 저해상도 미리보기의 긴 변 최대 길이 (픽셀)
+PREVIEW_MAX_SIDE = int(os.environ.get("CD_ROTATOR_PREVIEW_SIDE", "800"))
+
+# 세션 이미지 저장소 한도 (MB): 전체 / 세션 하나가 압축하지 않고 가질 수 있는 크기
+IMAGE_STORE_MB = int(os.environ.get("CD_ROTATOR_IMAGE_STORE_MB", "1024"))
+SESSION_IMAGE_MB = int(os.environ.get("CD_ROTATOR_SESSION_IMAGE_MB", "256"))
+
+# 회전 슬라이더용 DiscSpinner 캐시 크기 (모든 세션이 공유, 화면 표시 크기로 줄여 두므로 1024x1024 기준 하나에 약 17MB)
+SPINNER_CACHE_ENTRIES = int(os.environ.get("CD_ROTATOR_SPINNER_CACHE", "4"))
+
+# 다운로드용으로 인코딩한 결과 캐시 크기 (결과 키 + 형식/품질별)
+ENCODED_CACHE_ENTRIES = int(os.environ.get("CD_ROTATOR_ENCODED_CACHE", "32"))
+
+# 화면에 보내는 이미지의 긴 변 최대 길이 (픽셀) / 형식 (WEBP 또는 JPEG) / 품질
+DISPLAY_MAX_SIDE = int(os.environ.get("CD_ROTATOR_DISPLAY_SIDE", "1024"))
+DISPLAY_FORMAT = os.environ.get("CD_ROTATOR_DISPLAY_FORMAT", "WEBP")
+DISPLAY_QUALITY = int(os.environ.get("CD_ROTATOR_DISPLAY_QUALITY", "80"))
 
 # def merge_images(background_image, patch_image, position, is_transparent=True):   
 #     p_w, p_h = patch_image.size
@@ -81,38 +46,54 @@ def rotate_image(image, angle):
 
 #     return merged_image
 
-def merge_images(background_image, patch_image, position, radius, is_transparent=True):
-    p_w, p_h = patch_image.size
-    #radius = 60
-    c_x, c_y = p_w//2, p_h//2  #position[0], position[1]
-    c_w, c_h = min(radius, p_w // 2), min(radius, p_h // 2)
-    
-    # 이미지를 원의 크기에 맞게 자르기
-    mask = Image.new('L', patch_image.size, 255)
-    draw = ImageDraw.Draw(mask)
-    draw.ellipse((c_x - c_w, c_y - c_h, c_x + c_w, c_y + c_h), fill=0)
-    print("-"*100)
-    print(f"{c_x - c_w, c_y - c_h, c_x + c_w, c_y + c_h}")
-    patch_image.putalpha(mask)
-
-    merged_image = background_image.copy()
-
-    if is_transparent:
-        patch_image = remove_background(patch_image)
-    
-    # 원의 중심을 기준으로 merge
-    p_w, p_h = patch_image.size
-    new_position = (position[0] - p_w // 2, position[1] - p_h // 2)
-    merged_image.paste(patch_image, new_position, patch_image)
-    
-    return merged_image
-
+def _decode_image(data):
+    img_pil = Image.open(io.BytesIO(data)).convert("RGBA")
+    img_pil.load()
+    return img_pil
+
+@st.cache_resource(show_spinner=False)
+def _image_store():
+    # 모든 세션이 함께 쓰는 이미지 저장소 (같은 CD 이미지는 세션 수와 관계없이 한 번만 보관)
+    return ImageStore(IMAGE_STORE_MB << 20, SESSION_IMAGE_MB << 20)
+
+def _session_images():
+    # session_state 에는 이미지 대신 저장소 핸들만 둠 (세션이 끝나면 핸들과 함께 참조도 사라짐)
+    if "image_handles" not in st.session_state:
+        st.session_state["image_handles"] = _image_store().session()
+    return st.session_state["image_handles"]
+
+def _stored_image(name, key, build):
+    # 세션 저장소의 name 칸에 key 이미지를 두고 돌려줌
+    # 저장소에 같은 키가 있으면(다른 세션이 만든 것 포함) 그대로 쓰고, 없을 때만 build() 로 만듦
+    # 저장소의 이미지는 세션 사이에 같은 객체를 공유하므로 꺼내 쓰는 쪽에서 수정하면 안 됨
+    images = _session_images()
+    if images.key(name) == key:
+        return images.get(name)
+    image = images.find(key)
+    return images.set(name, image if image is not None else build(), key)
+
+def _resized_key(id, image):
+    # 리사이즈 결과의 저장소 키: 업로드 해시 + 크기 (다른 세션이 같은 파일을 같은 크기로 줄여도 같은 키)
+    digest = st.session_state.get(f"image_digest_{id}")
+    if digest is None:
+        return None
+    return f"{digest}:{image.width}x{image.height}"
+
+def _merged_key():
+    # 합성 결과의 저장소 키: 입력 이미지 키 + 합성 조건
+    images = _session_images()
+    params = repr((images.key("resized_bg_img"), images.key("resized_patch_img"), st.session_state["merge_params"]))
+    return "merged:" + hashlib.sha256(params.encode("utf-8")).hexdigest()
 
 def get_image(title, id):
     # background 이미지 업로드
     img_file = st.file_uploader(title, type=["jpg", "jpeg", "png"], key=f"file_uploader_{id}")
     if img_file:
-        img_pil = Image.open(img_file).convert("RGBA")
+        # 업로드 내용의 해시로 디코딩 결과를 저장소에 둠 (다른 입력만 바뀐 rerun 에서는 다시 디코딩하지 않음)
+        data = img_file.getvalue()
+        digest = hashlib.sha256(data).hexdigest()
+        st.session_state[f"image_digest_{id}"] = digest
+        img_pil = _stored_image(f"source_{id}", digest, lambda: _decode_image(data))
         #bg_width, bg_height = img_pil.size
         #st.image(img_pil)
         return img_pil
@@ -123,8 +104,13 @@ def resize_image(image, id):
     new_height = st.text_input("HEIGHT", value=height, key=f"new_height_{id}")
     resize_button = st.button("RESIZE", key=f"resize_button_{id}")
     if resize_button:
-        resized_image = image.resize((int(new_width), int(new_height)))
-        return resized_image
+        digest = st.session_state.get(f"image_digest_{id}")
+        if digest is None:
+            return image.resize((int(new_width), int(new_height)))
+        # 같은 원본을 같은 크기로 줄인 결과가 저장소에 있으면 재사용 (키: 해시 + 크기, _resized_key 와 같음)
+        size = (int(new_width), int(new_height))
+        resized_image = _session_images().find(f"{digest}:{size[0]}x{size[1]}")
+        return resized_image if resized_image is not None else image.resize(size)
     
 
 # def apply_patch(background_image, patch_image):
@@ -169,68 +155,26 @@ def resize_image(image, id):
 
 # from PIL import Image
 
-def make_hole(patch_image, radius):
-    p_w, p_h = patch_image.size
-    #radius = 60
-    c_x, c_y = p_w//2, p_h//2  #position[0], position[1]
-    c_w, c_h = min(radius, p_w // 2), min(radius, p_h // 2)
-    
-    # 이미지를 원의 크기에 맞게 자르기
-    mask = Image.new('L', patch_image.size, 255)
-    draw = ImageDraw.Draw(mask)
-    draw.ellipse((c_x - c_w, c_y - c_h, c_x + c_w, c_y + c_h), fill=0)
-    print("-"*100)
-    print(f"{c_x - c_w, c_y - c_h, c_x + c_w, c_y + c_h}")
-    patch_image.putalpha(mask)
-    return patch_image
-
-def apply_patch(background_image, patch_image, position, radius):
-    # # 이미지를 읽습니다.
-    # background_image = Image.open(background_image_path).convert("RGBA")
-    # patch_image = Image.open(patch_image_path).convert("RGBA")
-
-    patch_image = make_hole(patch_image, radius)
-    patch_image.save("0.hole.png")
-
-    # 이미지 크기 확인
-    if background_image.size != patch_image.size:
-        raise ValueError("배경 이미지와 패치 이미지는 같은 크기여야 합니다.")
-
-    # 배경 이미지의 알파 채널을 분리합니다.
-    bg_alpha = background_image.split()[3]
-    bg_alpha.save("1.bg_alpha.png")
- 
-    # 배경 이미지의 색상 있는 부분을 마스크로 만듭니다.
-    bg_mask = bg_alpha.point(lambda p: 255 if p > 0 else 0)
-    bg_mask.save("2.bg_mask.png")
-
-    # 배경 이미지의 색상 없는 부분을 반전한 마스크로 만듭니다.
-    bg_mask_inv = bg_mask.point(lambda p: 255 - p)
-    bg_mask_inv.save("3.bg_mask_inv.png")
-
-    # 패치 이미지를 배경 이미지의 색상 있는 부분에만 적용
-    patch_applied = Image.composite(patch_image, Image.new("RGBA", patch_image.size, (0, 0, 0, 0)), bg_mask)
-    patch_applied.save("4.patch_applied.png")
-
-    # 배경 이미지의 색상 없는 부분은 투명하게 처리
-    transparent_patch = Image.composite(Image.new("RGBA", patch_image.size, (0, 0, 0, 0)), patch_image, bg_mask_inv)
-    transparent_patch.save("5.transparent_patch.png")
-
-    # # 최종 이미지를 생성합니다.
-    # final_image = Image.alpha_composite(patch_applied, transparent_patch)
-    # final_image.save("6.final.png")
-
-    # 원의 중심을 기준으로 merge
-    p_w, p_h = patch_image.size
-    new_position = (position[0] - p_w // 2, position[1] - p_h // 2)
-    merged_image = background_image.copy()
-    merged_image.paste(transparent_patch, new_position, transparent_patch)
-
-    # 이미지를 파일로 저장합니다.
-    #final_image.save(output_image_path)
-    return merged_image
-
-
+def _proxy_image(name, image, scale, key):
+    # 미리보기용 축소본을 세션 저장소에 보관해 같은 원본(key)/배율이면 다시 줄이지 않음 (저장소 한도에 포함됨)
+    size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    return _stored_image(f"proxy_{name}", f"{key}:proxy:{scale}",
+                         lambda: image.resize(size, Image.BILINEAR, reducing_gap=2.0))
+
+def preview_patch(background_image, patch_image, position, radius, max_side=None, antialias=False,
+                  bg_key=None, patch_key=None):
+    # 긴 변이 max_side 이하가 되도록 줄인 배경/패치로 합성 (위치와 반지름도 같은 비율로 줄임)
+    # 화면 확인용이므로 디버그 이미지는 남기지 않음, 전체 해상도 결과는 저장할 때 apply_patch 로 따로 그림
+    # bg_key, patch_key: 입력 이미지의 저장소 키 (없으면 픽셀 내용으로 해시)
+    max_side = max_side or PREVIEW_MAX_SIDE
+    scale = min(1.0, max_side / max(background_image.size))
+    if scale >= 1.0:
+        return apply_patch(background_image, patch_image, position, radius, debug=False, antialias=antialias)
+    bg_proxy = _proxy_image("bg", background_image, scale, bg_key or image_digest(background_image))
+    patch_proxy = _proxy_image("patch", patch_image, scale, patch_key or image_digest(patch_image))
+    proxy_position = (int(round(position[0] * scale)), int(round(position[1] * scale)))
+    proxy_radius = max(0, int(round(radius * scale)))
+    return apply_patch(bg_proxy, patch_proxy, proxy_position, proxy_radius, debug=False, antialias=antialias)
 
 # def apply_patch(background_image, patch_image, radius):
 #     # 이미지 크기 확인
@@ -274,40 +218,107 @@ def apply_patch(background_image, patch_image, position, radius):
 
 
 
+def render_preview_image():
+    # MERGE 때 기억한 조건으로 저해상도 미리보기 합성 (입력 이미지와 조건이 같으면 세션 저장소에 있는 결과 재사용)
+    # 키에 입력 이미지 키가 들어 있으므로 MERGE 뒤에 RESIZE 해도 저장될 결과와 같은 입력으로 다시 그림
+    images = _session_images()
+    position, radius, antialias = st.session_state["merge_params"]
+    return _stored_image("merged_preview", f"{_merged_key()}:preview",
+                         lambda: preview_patch(images.get("resized_bg_img"),
+                                               images.get("resized_patch_img"),
+                                               position, radius, antialias=antialias,
+                                               bg_key=images.key("resized_bg_img"),
+                                               patch_key=images.key("resized_patch_img")))
+
+@st.cache_resource(max_entries=SPINNER_CACHE_ENTRIES, show_spinner=False)
+def _disc_spinner(key, max_side, _image):
+    # 회전 슬라이더용 DiscSpinner (key: 회전 전 이미지의 저장소 키, 모든 세션이 공유)
+    # 같은 키라면 저장소가 이미지를 압축/복원해도 정적 배경/ROI 를 다시 준비하지 않고 CD 영역만 다시 그림
+    # 화면에만 보이는 프레임이므로 긴 변이 max_side 이하가 되도록 한 번 줄인 이미지로 준비함
+    # DiscSpinner 는 내부 버퍼를 재사용하므로 같은 잠금 안에서 그리고 복사해야 함
+    scale = max_side / max(_image.size)
+    if scale < 1:
+        size = (max(1, round(_image.width * scale)), max(1, round(_image.height * scale)))
+        _image = _image.resize(size, Image.BILINEAR, reducing_gap=2.0)
+    return threading.Lock(), DiscSpinner(_rgba_array(_image))
+
+def rotate_shown_image(image, key, angle):
+    # 화면 표시 크기(DISPLAY_MAX_SIDE)로 회전한 프레임
+    lock, spinner = _disc_spinner(key, DISPLAY_MAX_SIDE, image)
+    with lock:
+        return rotate_cd(image, None, angle, spinner=spinner)
+
+def render_merged_image():
+    # MERGE 때 기억한 조건으로 원본 크기 합성 (같은 조건이면 저장소에 있는 결과 재사용)
+    images = _session_images()
+    key = _merged_key()
+    merged_image = images.get("merged_image") if images.key("merged_image") == key else None
+    if merged_image is None:
+        position, radius, antialias = st.session_state["merge_params"]
+        merged_image = apply_patch(images.get("resized_bg_img"),
+                                   images.get("resized_patch_img"),
+                                   position, radius,
+                                   session_id=st.session_state.setdefault("session_id", uuid.uuid4().hex[:8]),
+                                   antialias=antialias)
+        merged_image = images.set("merged_image", merged_image, key)
+    return merged_image
+
+# 같은 합성 결과를 같은 형식/품질로 다시 받으면 인코딩하지 않음 (key 는 이미지 저장소의 결과 키)
+@st.cache_resource(max_entries=ENCODED_CACHE_ENTRIES, show_spinner=False)
+def _encode_cached(key, fmt, quality, compress_level, lossless, _image):
+    return encode_image(_image, fmt, quality=quality, compress_level=compress_level, lossless=lossless)
+
+def encoded_merged_image(fmt, quality=90, compress_level=6, lossless=False):
+    merged_image = render_merged_image()
+    key = _session_images().key("merged_image")
+    return _encode_cached(key, fmt, quality, compress_level, lossless, merged_image)
+
+# 화면 표시용 인코딩 결과 (키는 이미지 내용을 대표하는 문자열)
+# 같은 바이트를 넘기면 streamlit 이 같은 미디어 URL 을 쓰므로 rerun 때 브라우저가 다시 받지 않음
+@st.cache_resource(max_entries=IMAGE_CACHE_ENTRIES * 4, show_spinner=False)
+def _preview_cached(key, max_side, fmt, quality, _image):
+    return encode_preview(_image, max_side=max_side, fmt=fmt, quality=quality)
+
+def show_image(image, key=None, caption=None):
+    # 원본 대신 줄여서 압축한 이미지를 st.image 로 보냄 (key 가 없으면 픽셀 내용으로 해시)
+    data = _preview_cached(key or image_digest(image), DISPLAY_MAX_SIDE, DISPLAY_FORMAT, DISPLAY_QUALITY, image)
+    st.image(data, caption=caption)
+
 def main():
     st.title("이미지 합치기")
+    images = _session_images()
     
     col1, col2 = st.columns(2)
     with col1:
         bg_img = get_image("배경 이미지", id=1)
         if bg_img:
-            st.image(bg_img)
+            show_image(bg_img, key=st.session_state.get("image_digest_1"))
             resized_bg_img = resize_image(bg_img, id=1)
             if resized_bg_img:
-                st.session_state["resized_bg_img"] = resized_bg_img
-        if "resized_bg_img" in st.session_state:
-            st.image(st.session_state["resized_bg_img"])
+                images.set("resized_bg_img", resized_bg_img, _resized_key(1, resized_bg_img))
+        if "resized_bg_img" in images:
+            show_image(images.get("resized_bg_img"), key=images.key("resized_bg_img"))
     with col2:
         patch_img = get_image("패치 이미지", id=2)
         if patch_img:
-            st.image(patch_img)
+            show_image(patch_img, key=st.session_state.get("image_digest_2"))
             resized_patch_img = resize_image(patch_img, id=2)
             if resized_patch_img:
-                st.session_state["resized_patch_img"] = resized_patch_img
-        if "resized_patch_img" in st.session_state:
-            st.image(st.session_state["resized_patch_img"])
+                images.set("resized_patch_img", resized_patch_img, _resized_key(2, resized_patch_img))
+        if "resized_patch_img" in images:
+            show_image(images.get("resized_patch_img"), key=images.key("resized_patch_img"))
 
 
     # 백그라운드 이미지 정보
-    if "resized_bg_img" in st.session_state and "resized_patch_img" in st.session_state:
+    if "resized_bg_img" in images and "resized_patch_img" in images:
         st.markdown("### 이미지 합치기")
-        bg_img_w, bg_img_h = st.session_state["resized_bg_img"].size
+        bg_img_w, bg_img_h = images.get("resized_bg_img").size
         st.write("Left Top (x1,y1)=(0, 0)")
         center_x, center_y = (int(bg_img_w/2), int(bg_img_h/2))
         st.write(f"Center (c1, c2) = ({center_x}, {center_y})")
         st.write(f"Right Bottom (x2, y2) = ({bg_img_w-1}, {bg_img_h-1})")
         # patch 이미지 정보
-        patch_img_w, patch_img_h = st.session_state["resized_patch_img"].size
+        patch_img_w, patch_img_h = images.get("resized_patch_img").size
         patch_cx, patch_cy = (int(patch_img_w/2), int(patch_img_h/2))
         st.write(f"패치 이미지 중심점 = ({patch_cx}, {patch_cy})")
     
@@ -316,6 +327,8 @@ def main():
         patch_y = st.text_input("Y 위치", value=center_y)
         radius = st.text_input("원의 반지름", value=50)
         is_transparent = st.checkbox("투명하게 붙이기", value=True)
+        antialias = st.checkbox("원 가장자리 부드럽게", value=False)
+        preview_mode = st.checkbox("저해상도 미리보기 (저장할 때만 원본 크기로 합성)", value=True)
         patch_button = st.button("MERGE")
         if patch_button:
             # merged_image = merge_images(st.session_state["resized_bg_img"], 
@@ -323,34 +336,63 @@ def main():
             #                             (int(patch_x), int(patch_y)), 
             #                             int(radius),
             #                             is_transparent=is_transparent)
-            merged_image = apply_patch(st.session_state["resized_bg_img"],
-                                       st.session_state["resized_patch_img"],
-                                       (int(patch_x), int(patch_y)),
-                                       int(radius))
-            st.session_state["merged_image"] = merged_image
-        if "merged_image" in st.session_state:
-            st.image(st.session_state["merged_image"])
+            # 합성 조건만 기억해 두고, 원본 크기 결과는 미리보기 모드에서는 저장할 때 한 번만 그림
+            st.session_state["merge_params"] = ((int(patch_x), int(patch_y)), int(radius), antialias)
+            images.discard("merged_image")
+            st.session_state.pop("save_requested", None)
+            if not preview_mode:
+                render_merged_image()
+        if "merge_params" in st.session_state:
+            if preview_mode:
+                shown_image = render_preview_image()
+                shown_key = f"{_merged_key()}:preview"
+                caption = f"미리보기 {shown_image.width} x {shown_image.height}"
+            else:
+                shown_image = render_merged_image()
+                shown_key = images.key("merged_image")
+                caption = None
+            # 각도를 바꾸면 합성된 배경은 그대로 두고 회전하는 CD 층만 다시 그림
+            # 각도별 프레임은 한 번 보고 지나가므로 공유 캐시에 넣지 않고 빠른 JPEG 로 바로 보냄
+            angle = st.slider("회전 각도", 0, 359, 0, key="spin_angle")
+            rotated = None
+            if angle:
+                try:
+                    rotated = rotate_shown_image(shown_image, shown_key, angle)
+                except ValueError as e:
+                    st.warning(str(e))
+            if rotated is not None:
+                st.image(encode_frame(rotated, max_side=DISPLAY_MAX_SIDE), caption=caption)
+            else:
+                show_image(shown_image, key=shown_key, caption=caption)
     
     # save
-    if "merged_image" in st.session_state:
-        merged_image_path = st.text_input("파일 저장 위치 및 이름", value="./merged_image.jpg")
+    if "merge_params" in st.session_state:
+        # 서버에 파일을 쓰지 않고 메모리에서 인코딩해 브라우저로 바로 내려받음
+        save_format = st.selectbox("저장 형식", ["PNG", "JPEG", "WEBP"], key="save_format")
+        quality, compress_level, lossless = 90, 6, False
+        if save_format == "PNG":
+            compress_level = st.slider("PNG 압축 수준 (높을수록 작고 느림)", 0, 9, 6, key="save_compress_level")
+        elif save_format == "WEBP":
+            lossless = st.checkbox("무손실 WebP", value=False)
+        if save_format == "JPEG" or (save_format == "WEBP" and not lossless):
+            quality = st.slider("품질", 1, 100, 90, key="save_quality")
+        if save_format == "JPEG":
+            st.caption("JPEG 는 투명한 부분을 흰색으로 채워 저장합니다.")
+        file_name = st.text_input("파일 이름", value="merged_image")
         save_button = st.button("SAVE")
         if save_button:
-            # 파일 저장 다이얼로그 열기
-            #file_path = "./merged_image.jpg" #st.sidebar.text_input("저장 경로", value="merged_image.jpg")  # 저장할 파일 경로와 이름 입력 필드
-            save_dir, save_file = os.path.split(merged_image_path)  # 경로와 파일 이름 분리
-
-            if save_dir and save_file:  # 경로와 파일 이름이 모두 입력되었을 경우에만 저장 수행
-                st.session_state["merged_image"].save(merged_image_path)  # 이미지 파일로 저장
-                st.success(f"이미지가 성공적으로 저장되었습니다. 파일 경로: {merged_image_path}")
-                
-                # 다운로드 버튼 생성
-                st.markdown(
-                    f'<a href="{merged_image_path}" download="{save_file}">Download Image</a>',
-                    unsafe_allow_html=True
-                )
+            st.session_state["save_requested"] = True
+        if st.session_state.get("save_requested"):
+            if file_name:
+                # 원본 크기로 합성해 인코딩 (같은 결과/형식/품질이면 캐시된 바이트를 그대로 씀)
+                data = encoded_merged_image(save_format, quality=quality, compress_level=compress_level,
+                                            lossless=lossless)
+                st.download_button("Download Image", data=data,
+                                   file_name=f"{os.path.splitext(file_name)[0]}.{file_extension(save_format)}",
+                                   mime=mime_type(save_format))
+                st.caption(f"{len(data) / 1024:.0f} KB")
             else:
-                st.warning("저장 경로와 파일 이름을 입력해주세요.")
+                st.warning("파일 이름을 입력해주세요.")
     
 if __name__ == "__main__":
     main()
\ No newline at end of file
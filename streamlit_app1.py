@@ -4,27 +4,67 @@ from PIL import Image, ImageDraw
 import os
 import numpy as np
 import math
+import functools
 import cv2
 
-def remove_background(patch_image):
-    # Patch 이미지를 RGBA 형식으로 변환
-    patch_rgba = patch_image.convert("RGBA")
-    
-    # Patch 이미지의 픽셀 데이터를 가져옴
-    pixels = patch_rgba.load()
-    
-    # 이미지의 너비와 높이를 가져옴
-    width, height = patch_rgba.size
-    
-    # 모든 픽셀을 순회하며 배경 부분을 투명하게 처리
-    for x in range(width):
-        for y in range(height):
-            r, g, b, a = pixels[x, y]  # 픽셀의 RGBA 값 가져오기
-            
-            # 예시로 흰색 배경을 제거하는 것으로 가정
-            if r > 200 and g > 200 and b > 200:
-                pixels[x, y] = (r, g, b, 0)  # 배경 부분을 투명하게 처리
-    return patch_rgba
+def _key_thresholds(threshold, tolerance):
+    # 채널별 기준값 = threshold - tolerance (R, G, B 각각)
+    th = np.broadcast_to(np.asarray(threshold, dtype=np.int16), (3,))
+    tol = np.broadcast_to(np.asarray(tolerance, dtype=np.int16), (3,))
+    return np.clip(th - tol, 0, 255).astype(np.uint8)
+
+@functools.lru_cache(maxsize=4)
+def _soft_key_cube(key_color, key_range):
+    # 채널별 256 크기 LUT: (값 - 키 색상)^2
+    values = np.arange(256, dtype=np.int32)
+    lut_r, lut_g, lut_b = ((values - int(k)) ** 2 for k in key_color)
+
+    # 거리^2 -> 알파 비율(0~255) LUT
+    # inner 이하: 완전 투명, outer 이상: 원래 알파 유지, 그 사이: 선형 보간
+    inner, outer = key_range
+    distance = np.sqrt(np.arange(3 * 255 ** 2 + 1, dtype=np.float32))
+    ramp = np.clip((distance - inner) / max(outer - inner, 1e-6), 0.0, 1.0)
+    alpha_lut = np.round(ramp * 255).astype(np.uint8)
+
+    # 256^3 색상 큐브 (16MB): 인덱스 = r | g << 8 | b << 16
+    # 픽셀당 테이블 조회 한 번으로 알파 비율을 얻기 위해 키 색상별로 한 번만 만들어 둠
+    cube = alpha_lut[lut_b[:, None, None] + lut_g[None, :, None] + lut_r[None, None, :]]
+    cube = cube.ravel()
+    cube.flags.writeable = False
+    return cube
+
+def remove_background(patch_image, threshold=200, tolerance=0, mode="hard",
+                      key_color=(255, 255, 255), key_range=(50, 100)):
+    # Patch 이미지를 RGBA 형식으로 변환한 뒤 numpy 배열로 가져옴 (H x W x 4)
+    # 이미 RGBA 라면 convert 로 인한 불필요한 복사를 생략
+    if patch_image.mode != "RGBA":
+        patch_image = patch_image.convert("RGBA")
+    patch_array = np.array(patch_image)
+
+    if mode == "soft":
+        # 키 색상과의 거리에 따라 알파를 단계적으로 줄임 (가장자리 부드럽게)
+        cube = _soft_key_cube(tuple(key_color), tuple(key_range))
+        # RGBA 4바이트를 little-endian uint32 로 보고 알파 바이트를 제거하면 큐브 인덱스가 됨
+        rgb_index = patch_array.view("<u4")[..., 0] & 0xFFFFFF
+        alpha = cube[rgb_index].astype(np.uint16)
+        alpha *= patch_array[..., 3]
+        alpha += 127
+        alpha //= 255
+        patch_array[..., 3] = alpha
+        return Image.fromarray(patch_array, "RGBA")
+    if mode != "hard":
+        raise ValueError(f"지원하지 않는 배경 제거 모드입니다: {mode}")
+
+    # 채널별 기준값보다 밝은 픽셀을 배경(흰색)으로 판단
+    # 기본값(threshold=200, tolerance=0)은 r > 200 and g > 200 and b > 200 과 동일
+    th_r, th_g, th_b = _key_thresholds(threshold, tolerance)
+    background = patch_array[..., 0] > th_r
+    background &= patch_array[..., 1] > th_g
+    background &= patch_array[..., 2] > th_b
+
+    # 배경 부분의 알파값만 0으로 만들어 투명하게 처리
+    patch_array[..., 3][background] = 0
+    return Image.fromarray(patch_array, "RGBA")
 
 def rotate_cd(cd_image, patch_image, angle):
     # CD 이미지를 numpy 배열로 변환
@@ -81,7 +121,8 @@ def rotate_image(image, angle):
 
 #     return merged_image
 
-def merge_images(background_image, patch_image, position, radius, is_transparent=True):
+def merge_images(background_image, patch_image, position, radius, is_transparent=True,
+                 key_mode="hard"):
     p_w, p_h = patch_image.size
     #radius = 60
     c_x, c_y = p_w//2, p_h//2  #position[0], position[1]
@@ -98,7 +139,7 @@ def merge_images(background_image, patch_image, position, radius, is_transparent
     merged_image = background_image.copy()
 
     if is_transparent:
-        patch_image = remove_background(patch_image)
+        patch_image = remove_background(patch_image, mode=key_mode)
     
     # 원의 중심을 기준으로 merge
     p_w, p_h = patch_image.size
@@ -168,13 +209,16 @@ def main():
         patch_y = st.text_input("Y 위치", value=center_y)
         radius = st.text_input("원의 반지름", value=50)
         is_transparent = st.checkbox("투명하게 붙이기", value=True)
+        key_mode = st.radio("배경 제거 방식", ["hard", "soft"], horizontal=True,
+                            disabled=not is_transparent)
         patch_button = st.button("MERGE")
         if patch_button:
             merged_image = merge_images(st.session_state["resized_bg_img"], 
                                         st.session_state["resized_patch_img"], 
                                         (int(patch_x), int(patch_y)), 
                                         int(radius),
-                                        is_transparent=is_transparent)
+                                        is_transparent=is_transparent,
+                                        key_mode=key_mode)
             st.session_state["merged_image"] = merged_image
         if "merged_image" in st.session_state:
             st.image(st.session_state["merged_image"])
@@ -0,0 +1,74 @@
+import os
+import struct
+import sys
+
+import cv2
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import animation
+
+
+def _gif_frame_rects(data):
+    # GIF 의 이미지 설명자마다 (x, y, 너비, 높이)
+    rects = []
+    pos = 13
+    if data[10] & 0x80:
+        pos += 3 * (2 << (data[10] & 0x07))
+    while pos < len(data) and data[pos] != 0x3b:
+        if data[pos] == 0x21:
+            pos += 2
+        else:
+            rects.append(struct.unpack("<HHHH", data[pos + 1:pos + 9]))
+            flags = data[pos + 9]
+            pos += 10
+            if flags & 0x80:
+                pos += 3 * (2 << (flags & 0x07))
+            pos += 1
+        while data[pos]:
+            pos += data[pos] + 1
+        pos += 1
+    return rects
+
+
+def _spin_source():
+    # 400x400 캔버스 가운데 반지름 100 의 CD, 가장자리가 울퉁불퉁해 돌 때마다 알파가 기준을 넘나드는 픽셀이 있음
+    image = np.zeros((400, 400, 4), np.uint8)
+    cv2.circle(image, (200, 200), 100, (200, 40, 40, 255), -1)
+    cv2.line(image, (200, 200), (290, 200), (40, 200, 40, 255), 9)
+    for angle in range(0, 360, 5):
+        t = np.deg2rad(angle)
+        cv2.circle(image, (int(200 + 101 * np.cos(t)), int(200 + 101 * np.sin(t))), 3, (255, 255, 0, 255), -1)
+    return image
+
+
+def _gif_frames(path):
+    image = Image.open(path)
+    frames = []
+    for index in range(image.n_frames):
+        image.seek(index)
+        frames.append(np.array(image.convert("RGBA")))
+    return frames
+
+
+def test_gif_delta_frames_stay_inside_disc(tmp_path):
+    path = str(tmp_path / "spin.gif")
+    animation.export_spin(path, _spin_source(), frames=12, fps=12, disc=(200, 200, 104))
+    rects = _gif_frame_rects(open(path, "rb").read())
+    # 첫 프레임만 전체 캔버스, 나머지는 CD 영역 안의 부분 프레임
+    assert rects[0] == (0, 0, 400, 400)
+    for x, y, width, height in rects[1:]:
+        assert x >= 95 and y >= 95 and x + width <= 305 and y + height <= 305
+
+
+def test_gif_delta_frames_match_full_frames(tmp_path):
+    delta, full = str(tmp_path / "delta.gif"), str(tmp_path / "full.gif")
+    animation.export_spin(delta, _spin_source(), frames=12, fps=12, disc=(200, 200, 104))
+    animation.export_spin(full, _spin_source(), frames=12, fps=12, disc=(200, 200, 104), optimize=False)
+    # 첫 프레임은 전체 캔버스 + 지울 영역 두 블록으로 나뉘어 기록됨
+    delta_frames, full_frames = _gif_frames(delta)[1:], _gif_frames(full)
+    assert len(delta_frames) == len(full_frames)
+    for a, b in zip(delta_frames, full_frames):
+        assert np.array_equal(a[..., 3] > 0, b[..., 3] > 0)
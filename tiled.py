@@ -0,0 +1,175 @@
+import os
+import struct
+import zlib
+
+import numpy as np
+from PIL import Image
+
+from core import _blend_patch, _ellipse_mask
+
+
+# 아주 큰(인쇄용 10k px 이상) CD 이미지를 가로 띠(strip) 단위로 합성해 바로 파일에 씀
+# 메모리에는 띠 하나 크기의 버퍼와 구멍 영역 마스크만 두므로 전체 크기 RGBA 사본을 만들지 않음
+# 입력을 .npy (memmap) 로 주면 입력도 띠 단위로만 읽힘
+# (PNG/JPEG 입력은 PIL 이 처음 잘라 읽을 때 원본 모드로 한 번 전체 디코딩하므로 메모리가 띠 크기로 줄지 않음,
+#  명령줄의 compose --tiled 는 open_strip_source 로 .npy 또는 에셋 저장소의 memmap 만 받음)
+
+
+def _png_chunk(chunk_type, payload):
+    return struct.pack(">I", len(payload)) + chunk_type + payload + struct.pack(">I", zlib.crc32(chunk_type + payload))
+
+
+class PngStripWriter:
+    # 위에서부터 띠 단위로 받은 RGBA 행을 PNG 로 스트리밍 저장
+    # 행마다 Up 필터(바로 위 행과의 차이)를 적용하고 zlib 스트림으로 압축해 IDAT 청크로 내보냄
+    def __init__(self, fp, width, height, compress_level=6):
+        self.fp = fp
+        self.width = width
+        self.height = height
+        self._compressor = zlib.compressobj(compress_level)
+        self._previous = np.zeros((1, width * 4), dtype=np.uint8)
+        self._rows = 0
+        fp.write(b"\x89PNG\r\n\x1a\n")
+        fp.write(_png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)))
+
+    def write(self, rows):
+        rows = rows.reshape(rows.shape[0], self.width * 4)
+        filtered = np.empty((rows.shape[0], self.width * 4 + 1), dtype=np.uint8)
+        filtered[:, 0] = 2
+        np.subtract(rows[:1], self._previous, out=filtered[:1, 1:])
+        np.subtract(rows[1:], rows[:-1], out=filtered[1:, 1:])
+        self._previous = rows[-1:].copy()
+        self._rows += rows.shape[0]
+        data = self._compressor.compress(filtered)
+        if data:
+            self.fp.write(_png_chunk(b"IDAT", data))
+
+    def close(self):
+        if self._rows != self.height:
+            raise ValueError(f"PNG 행 수가 맞지 않습니다: {self._rows} / {self.height}")
+        self.fp.write(_png_chunk(b"IDAT", self._compressor.flush()))
+        self.fp.write(_png_chunk(b"IEND", b""))
+
+
+class NpyStripWriter:
+    # 띠 단위로 받은 행을 .npy (H x W x 4 uint8) memmap 에 차례로 씀
+    def __init__(self, path, width, height):
+        self._array = np.lib.format.open_memmap(path, mode="w+", dtype=np.uint8, shape=(height, width, 4))
+        self._rows = 0
+
+    def write(self, rows):
+        self._array[self._rows:self._rows + rows.shape[0]] = rows
+        self._rows += rows.shape[0]
+
+    def close(self):
+        self._array.flush()
+        self._array = None
+
+
+def open_source(source):
+    # 경로(.npy 는 memmap, 그 밖의 이미지는 PIL 지연 로딩), PIL 이미지, 배열을 그대로 받음
+    if isinstance(source, (str, os.PathLike)):
+        if os.fspath(source).lower().endswith(".npy"):
+            return np.load(source, mmap_mode="r")
+        return Image.open(source)
+    return source
+
+
+def open_strip_source(path):
+    # 띠 단위로만 읽을 수 있는 입력: .npy 는 memmap, PNG/JPEG 는 에셋 저장소(assets.py)에 최신 .npy 가 있으면 그 memmap
+    # PNG/JPEG 는 띠 단위로 디코딩할 수 없어 전체 크기만큼 메모리를 쓰므로 저장소가 없으면 ValueError
+    if os.fspath(path).lower().endswith(".npy"):
+        return np.load(path, mmap_mode="r")
+    from assets import open_store
+
+    store = open_store(path)
+    name = os.path.basename(path)
+    if store is not None and name in store and store._is_fresh(name):
+        return store.load(name)
+    directory = os.path.dirname(os.path.abspath(path))
+    raise ValueError(f"띠 단위 합성은 .npy 나 에셋 저장소에 색인된 이미지만 읽을 수 있습니다: {path} "
+                     f"(먼저 python cli.py assets \"{directory}\" 로 색인하세요)")
+
+
+def source_size(source):
+    if isinstance(source, Image.Image):
+        return source.size
+    return source.shape[1], source.shape[0]
+
+
+def read_region(source, x0, y0, x1, y1):
+    # (x0, y0) - (x1, y1) 영역만 RGBA uint8 배열로 읽음
+    if isinstance(source, Image.Image):
+        region = source.crop((x0, y0, x1, y1))
+        if region.mode != "RGBA":
+            region = region.convert("RGBA")
+        return np.asarray(region)
+    region = source[y0:y1, x0:x1]
+    if region.ndim == 2:
+        region = np.repeat(region[..., None], 3, axis=2)
+    if region.shape[2] == 3:
+        alpha = np.full(region.shape[:2] + (1,), 255, dtype=np.uint8)
+        region = np.concatenate([region, alpha], axis=2)
+    return np.ascontiguousarray(region, dtype=np.uint8)
+
+
+def apply_patch_tiled(background, patch, position, radius, output, strip_height=256, antialias=False,
+                      compress_level=6):
+    # apply_patch 와 같은 결과를 띠 단위로 계산해 output (.png 또는 .npy) 에 씀
+    background = open_source(background)
+    patch = open_source(patch)
+    width, height = source_size(background)
+    p_w, p_h = source_size(patch)
+    if (width, height) != (p_w, p_h):
+        raise ValueError("배경 이미지와 패치 이미지는 같은 크기여야 합니다.")
+
+    # 패치 좌상단의 배경 좌표와, 배경 안에 들어오는 패치의 가로 범위
+    o_x, o_y = position[0] - p_w // 2, position[1] - p_h // 2
+    x0, x1 = max(0, o_x), min(width, o_x + p_w)
+
+    # 구멍 마스크는 원을 감싸는 사각형 + 1픽셀 여유 크기로만 만들고, 그 밖은 255 로 취급
+    # (antialias 경계는 타원 사각형 밖 1픽셀까지 걸치므로 apply_patch 와 같으려면 여유가 필요함)
+    c_w, c_h = min(radius, p_w // 2), min(radius, p_h // 2)
+    hole = _ellipse_mask((2 * c_w + 3, 2 * c_h + 3), (c_w + 1, c_h + 1), (c_w, c_h), antialias)
+    hole_x, hole_y = o_x + p_w // 2 - c_w - 1, o_y + p_h // 2 - c_h - 1
+
+    ext = os.path.splitext(os.fspath(output))[1].lower()
+    fp = None
+    if ext == ".npy":
+        writer = NpyStripWriter(output, width, height)
+    elif ext == ".png":
+        fp = open(output, "wb")
+        writer = PngStripWriter(fp, width, height, compress_level=compress_level)
+    else:
+        raise ValueError(f"타일 합성 결과는 .png 또는 .npy 로만 저장할 수 있습니다: {ext}")
+
+    try:
+        for y0 in range(0, height, strip_height):
+            y1 = min(height, y0 + strip_height)
+            strip = read_region(background, 0, y0, width, y1)
+            if not strip.flags.writeable:
+                strip = strip.copy()
+
+            # 이 띠와 겹치는 패치 행만 합성
+            p_y0, p_y1 = max(y0, o_y), min(y1, o_y + p_h)
+            if x0 < x1 and p_y0 < p_y1:
+                dst = strip[p_y0 - y0:p_y1 - y0, x0:x1]
+                patch_src = read_region(patch, x0 - o_x, p_y0 - o_y, x1 - o_x, p_y1 - o_y)
+
+                # 패치의 알파 = 구멍 마스크, 단 배경 알파가 0 인 곳(색상 없는 부분)은 투명
+                # (apply_patch 와 같이 배경 알파는 붙일 위치가 아니라 패치 좌표에서 읽음)
+                bg_alpha = read_region(background, x0 - o_x, p_y0 - o_y, x1 - o_x, p_y1 - o_y)[..., 3]
+                mask = np.full(dst.shape[:2], 255, dtype=np.uint8)
+                h_x0, h_x1 = max(x0, hole_x), min(x1, hole_x + hole.shape[1])
+                h_y0, h_y1 = max(p_y0, hole_y), min(p_y1, hole_y + hole.shape[0])
+                if h_x0 < h_x1 and h_y0 < h_y1:
+                    mask[h_y0 - p_y0:h_y1 - p_y0, h_x0 - x0:h_x1 - x0] = \
+                        hole[h_y0 - hole_y:h_y1 - hole_y, h_x0 - hole_x:h_x1 - hole_x]
+                mask *= bg_alpha > 0
+                _blend_patch(dst, patch_src, mask)
+            writer.write(strip)
+        writer.close()
+    finally:
+        if fp is not None:
+            fp.close()
+    return output